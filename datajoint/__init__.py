@@ -23,7 +23,7 @@ __all__ = ['__author__', '__version__',
            'config', 'conn', 'kill', 'BaseRelation',
            'Connection', 'Heading', 'FreeRelation', 'Not', 'schema',
            'Manual', 'Lookup', 'Imported', 'Computed', 'Part',
-           'AndList', 'OrList', 'ERD', 'U',
+           'AndList', 'OrList', 'ERD', 'U', 'QueryStats',
            'set_password']
 
 
@@ -68,11 +68,41 @@ from .base_relation import FreeRelation, BaseRelation
 from .user_relations import Manual, Lookup, Imported, Computed, Part
 from .relational_operand import Not, AndList, OrList, U
 from .heading import Heading
+from .instrumentation import QueryStats
 from .schema import Schema as schema
-from .erd import ERD
 from .admin import set_password, kill
 
 
+class _LazyERD(type):
+    """
+    Metaclass of dj.ERD, which imports datajoint.erd on first use since it loads networkx and matplotlib.
+    Instantiation, isinstance, and attribute access are forwarded to datajoint.erd.ERD.
+    """
+    @staticmethod
+    def _erd():
+        from .erd import ERD
+        return ERD
+
+    def __call__(cls, *args, **kwargs):
+        return cls._erd()(*args, **kwargs)
+
+    def __instancecheck__(cls, instance):
+        return isinstance(instance, cls._erd())
+
+    def __subclasscheck__(cls, subclass):
+        return issubclass(subclass, cls._erd())
+
+    def __getattr__(cls, name):
+        return getattr(cls._erd(), name)
+
+
+class ERD(metaclass=_LazyERD):
+    """
+    Entity relationship diagram. See datajoint.erd.ERD.
+    """
+    pass
+
+
 def create_virtual_module(modulename, dbname):
     """
     Creates a python module with the given name from a database name in mysql with datajoint tables.
@@ -2,11 +2,17 @@
 import logging
 import datetime
 import random
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
 from pymysql import OperationalError
-from .relational_operand import RelationalOperand, AndList
+from pymysql.converters import escape_item
+from .relational_operand import RelationalOperand, AndList, U
 from . import DataJointError
 from . import key as KEY
 from .base_relation import FreeRelation
+from .jobs import key_hash, Heartbeat
+from .instrumentation import operation
 import signal
 
 # noinspection PyExceptionInherit,PyCallingNonCallable
@@ -14,6 +20,30 @@ import signal
 logger = logging.getLogger(__name__)
 
 
+KEY_PAGE_SIZE = 10000   # number of keys fetched at once by populate
+
+
+def keyset_condition(primary_key, key, operator):
+    """
+    Makes the SQL condition comparing the primary key of tuples to that of key in lexicographic order.
+    The condition is written as a disjunction of simple comparisons so that MySQL can use the primary index.
+    :param primary_key: list of primary key attributes in the order of the index
+    :param key: dict containing the values of primary_key
+    :param operator: one of '>', '>=', '<', '<='
+    :return: SQL condition string
+    """
+    def literal(value):
+        return escape_item(value.item() if isinstance(value, np.generic) else value, 'utf8')
+
+    strict = operator.rstrip('=')
+    equalities = ['`%s`=%s' % (attr, literal(key[attr])) for attr in primary_key]
+    conditions = [' AND '.join(equalities[:i] + ['`%s`%s%s' % (attr, strict, literal(key[attr]))])
+                  for i, attr in enumerate(primary_key)]
+    if operator.endswith('='):
+        conditions.append(' AND '.join(equalities))
+    return '(' + ') OR ('.join(conditions) + ')'
+
+
 class AutoPopulate:
     """
     AutoPopulate is a mixin class that adds the method populate() to a Relation class.
@@ -48,6 +78,16 @@ class AutoPopulate:
         """
         raise NotImplementedError('Subclasses of AutoPopulate must implement the method "_make_tuples"')
 
+    def _make_batch(self, keys):
+        """
+        Called by populate(batch_size=n) to populate several keys in one transaction.
+        The default implementation calls _make_tuples for each key.  Derived classes may override it to fetch
+        the upstream data for all keys at once, compute in vectorized form, and insert all results with one insert.
+        :param keys: list of dicts with the primary keys to populate
+        """
+        for key in keys:
+            self._make_tuples(key)
+
     @property
     def target(self):
         """
@@ -63,7 +103,10 @@ class AutoPopulate:
         """
         return key
 
-    def populate(self, *restrictions, suppress_errors=False, reserve_jobs=False, order="original", limit=None):
+    @operation('populate')
+    def populate(self, *restrictions, suppress_errors=False, reserve_jobs=False, order="original", limit=None,
+                 processes=1, reserve_batch_size=1, batch_size=1,
+                 reclaim_stale=False, stale_timeout=None, heartbeat_interval=None):
         """
         rel.populate() calls rel._make_tuples(key) for every primary key in self.key_source
         for which there is not already a tuple in rel.
@@ -73,6 +116,17 @@ class AutoPopulate:
         :param reserve_jobs: if true, reserves job to populate in asynchronous fashion
         :param order: "original"|"reverse"|"random"  - the order of execution
         :param limit: if not None, populates at max that many keys
+        :param processes: number of worker processes. Each worker opens its own connection to the server.
+            Requires the fork start method of multiprocessing, which is the default only on Linux.
+        :param reserve_batch_size: with reserve_jobs, the number of jobs reserved and completed in one round trip.
+        :param batch_size: number of keys populated in one transaction by self._make_batch. If a batch fails,
+            its keys are populated one at a time so that errors are reported for individual keys.
+        :param reclaim_stale: with reserve_jobs, first release the reservations of jobs whose workers have died.
+        :param stale_timeout: with reclaim_stale, also release reservations whose heartbeat is older than
+            stale_timeout seconds.
+        :param heartbeat_interval: with reserve_jobs, seconds between heartbeats sent for the reserved jobs.
+            None = no heartbeats. The heartbeats are sent through a separate connection opened for the duration
+            of populate.
         """
         if self.connection.in_transaction:
             raise DataJointError('Populate cannot be called during a transaction.')
@@ -81,6 +135,15 @@ class AutoPopulate:
         if order not in valid_order:
             raise DataJointError('The order argument must be one of %s' % str(valid_order))
 
+        if processes < 1 or reserve_batch_size < 1 or batch_size < 1:
+            raise DataJointError('processes, reserve_batch_size, and batch_size must be positive integers')
+
+        # allow_none avoids fixing the default context so that users may still call set_start_method
+        if processes > 1 and (mp.get_start_method(allow_none=True) or mp.get_all_start_methods()[0]) != 'fork':
+            raise DataJointError('populate with processes > 1 requires the fork start method of multiprocessing. '
+                                 'Where fork is available and safe, select it with '
+                                 'multiprocessing.set_start_method("fork").')
+
         todo = self.key_source
         if not isinstance(todo, RelationalOperand):
             raise DataJointError('Invalid key_source value')
@@ -97,51 +160,198 @@ class AutoPopulate:
                 raise SystemExit('SIGTERM received')
             old_handler = signal.signal(signal.SIGTERM, handler)
 
-        todo -= self.target
-        keys = todo.fetch(KEY, limit=limit)
-        if order == "reverse":
-            keys.reverse()
-        elif order == "random":
-            random.shuffle(keys)
+        try:
+            if reserve_jobs and reclaim_stale:
+                jobs.reclaim_stale(stale_timeout)
 
-        logger.info('Found %d keys to populate' % len(keys))
-        for key in keys:
-            if not reserve_jobs or jobs.reserve(self.target.table_name, self._job_key(key)):
-                self.connection.start_transaction()
-                if key in self.target:  # already populated
-                    self.connection.cancel_transaction()
-                    if reserve_jobs:
-                        jobs.complete(self.target.table_name, self._job_key(key))
+            todo -= self.target
+            pages = self._iter_key_pages(todo, order, limit)
+            chunk_size = max(batch_size, reserve_batch_size if reserve_jobs else 1)
+
+            def make_chunks(page):
+                return [page[i:i + chunk_size] for i in range(0, len(page), chunk_size)]
+
+            heartbeat_interval = heartbeat_interval if reserve_jobs else None
+            if processes == 1:
+                heartbeat = None
+                if heartbeat_interval is not None:
+                    heartbeat = Heartbeat(jobs, heartbeat_interval)
+                    heartbeat.start()
+                try:
+                    for page in pages:
+                        for chunk in make_chunks(page):
+                            errors = self._populate_chunk(chunk, jobs, suppress_errors, batch_size)
+                            if errors:
+                                error_list.extend(errors)
+                finally:
+                    if heartbeat is not None:
+                        heartbeat.stop()
+            else:
+                # Forked workers inherit the relation since relations and connections cannot be pickled. Each worker
+                # opens its own connection on its first chunk without using or closing the inherited socket of the
+                # parent, which keeps its connection to read the pages of keys.
+                if heartbeat_interval is not None:
+                    jobs.require_heartbeat()   # altered once here rather than concurrently by the workers
+                pool = mp.Pool(processes, _initialize_populate,
+                               (self, jobs, suppress_errors, batch_size, heartbeat_interval))
+                try:
+                    for page in pages:   # pages are submitted one at a time to keep memory bounded
+                        for errors in pool.imap(_call_populate_chunk, make_chunks(page), chunksize=1):
+                            if errors:
+                                error_list.extend(errors)
+                except:
+                    # the workers are killed with SIGTERM, which leaves their jobs reserved rather than logged as errors
+                    pool.terminate()
+                    raise
                 else:
-                    logger.info('Populating: ' + str(key))
-                    try:
-                        self._make_tuples(dict(key))
-                    except (KeyboardInterrupt, SystemExit, Exception) as error:
-                        try:
-                            self.connection.cancel_transaction()
-                        except OperationalError:
-                            pass
-                        if reserve_jobs:
-                            # show error name and error message (if any)
-                            error_message = ': '.join([error.__class__.__name__, str(error)]).strip(': ')
-                            jobs.error(self.target.table_name, self._job_key(key), error_message=error_message)
-
-                        if not suppress_errors or isinstance(error, SystemExit):
-                            raise
-                        else:
-                            logger.error(error)
-                            error_list.append((key, error))
-                    else:
-                        self.connection.commit_transaction()
-                        if reserve_jobs:
-                            jobs.complete(self.target.table_name, self._job_key(key))
-
-        # place back the original signal handler
-        if reserve_jobs:
-            signal.signal(signal.SIGTERM, old_handler)
+                    pool.close()   # let the workers finish and exit without SIGTERM
+                finally:
+                    pool.join()
+        finally:
+            # place back the original signal handler
+            if reserve_jobs:
+                signal.signal(signal.SIGTERM, old_handler)
 
         return error_list
 
+    @staticmethod
+    def _iter_key_pages(todo, order, limit):
+        """
+        Generates the keys to populate in pages of at most KEY_PAGE_SIZE keys using keyset pagination on
+        the primary key.  Each page is fetched when needed, so keys populated in the meantime are skipped.
+        The random order starts at a randomly sampled key, wraps around, and shuffles the keys within each page.
+        :param todo: the relation of keys to populate
+        :param order: "original"|"reverse"|"random"
+        :param limit: if not None, the maximum total number of keys
+        """
+        primary_key = todo.primary_key
+        if order == 'random':
+            pivot = todo.fetch(KEY, order_by=['RAND()'], limit=1)
+            if not pivot:
+                return
+            passes = [(keyset_condition(primary_key, pivot[0], '>='), None),
+                      (None, keyset_condition(primary_key, pivot[0], '<'))]
+        else:
+            passes = [(None, None)]
+        descending = order == 'reverse'
+        order_by = ['`%s`%s' % (attr, ' DESC' if descending else '') for attr in primary_key]
+        count = 0
+        for start, stop in passes:
+            while limit is None or count < limit:
+                page = (todo & AndList(c for c in (start, stop) if c is not None)).fetch(
+                    KEY, order_by=order_by,
+                    limit=KEY_PAGE_SIZE if limit is None else min(KEY_PAGE_SIZE, limit - count))
+                if not page:
+                    break
+                count += len(page)
+                start = keyset_condition(primary_key, page[-1], '<' if descending else '>')
+                if order == 'random':
+                    random.shuffle(page)
+                logger.info('Found %d keys to populate' % len(page))
+                yield page
+
+    @operation('populate')
+    def _populate_chunk(self, keys, jobs, suppress_errors, batch_size=1):
+        """
+        populates the table for a list of keys. When jobs are reserved, the jobs for all keys in the list
+        are reserved and completed with one query each.
+        :param keys: list of dicts specifying the jobs to populate
+        :param jobs: the job table or None if jobs are not reserved
+        :param suppress_errors: if True, errors are returned rather than raised
+        :param batch_size: number of keys to populate in one transaction
+        :return: list of (key, error) tuples for suppressed errors
+        """
+        reserved = jobs is not None and len(keys) > 1
+        if reserved:
+            table_name = self.target.table_name
+            groups = OrderedDict()   # job hash -> keys, since _job_key may map several keys to the same job
+            for key in keys:
+                groups.setdefault(key_hash(self._job_key(key)), []).append(key)
+            keys = [key for job_key in jobs.reserve_batch(table_name, (self._job_key(group[0])
+                                                                      for group in groups.values()))
+                    for key in groups[key_hash(job_key)]]
+        errors = []
+        try:
+            for i in range(0, len(keys), batch_size):
+                batch = keys[i:i + batch_size]
+                if len(batch) > 1 and self._populate_batch(batch):
+                    continue
+                errors.extend(error for error in (
+                    self._populate1(key, jobs, suppress_errors, reserved=reserved) for key in batch)
+                              if error is not None)
+        finally:
+            if reserved:
+                # complete finished jobs and release the jobs that were not attempted. Errors remain logged.
+                jobs.complete_batch(table_name, (self._job_key(key) for key in keys))
+        return errors
+
+    def _populate_batch(self, keys):
+        """
+        populates the table for a list of keys in one transaction, calling self._make_batch.
+        :param keys: list of dicts specifying the jobs to populate
+        :return: True if the batch was committed.  False if it failed and was rolled back.
+        """
+        self.connection.start_transaction()
+        try:
+            populated = set(key_hash(key) for key in (U(*keys[0]) & (self.target & keys)).fetch(as_dict=True))
+            keys = [dict(key) for key in keys if key_hash(key) not in populated]
+            if keys:
+                logger.info('Populating batch of %d keys' % len(keys))
+                self._make_batch(keys)
+        except (KeyboardInterrupt, SystemExit):
+            self.connection.cancel_transaction()
+            raise
+        except Exception as error:
+            try:
+                self.connection.cancel_transaction()
+            except OperationalError:
+                pass
+            logger.warning('Batch failed with %s. Populating its keys one at a time.' % error.__class__.__name__)
+            return False
+        else:
+            self.connection.commit_transaction()
+            return True
+
+    def _populate1(self, key, jobs, suppress_errors, reserved=False):
+        """
+        populates the table for one key, calling self._make_tuples in a transaction.
+        :param key: dict specifying the job to populate
+        :param jobs: the job table or None if jobs are not reserved
+        :param suppress_errors: if True, errors are returned rather than raised
+        :param reserved: if True, the job is already reserved and its completion is left to the caller
+        :return: (key, error) if an error was suppressed, otherwise None
+        """
+        if jobs is not None and not reserved and not jobs.reserve(self.target.table_name, self._job_key(key)):
+            return None
+        self.connection.start_transaction()
+        if key in self.target:  # already populated
+            self.connection.cancel_transaction()
+            if jobs is not None and not reserved:
+                jobs.complete(self.target.table_name, self._job_key(key))
+            return None
+        logger.info('Populating: ' + str(key))
+        try:
+            self._make_tuples(dict(key))
+        except (KeyboardInterrupt, SystemExit, Exception) as error:
+            try:
+                self.connection.cancel_transaction()
+            except OperationalError:
+                pass
+            if jobs is not None:
+                # show error name and error message (if any)
+                error_message = ': '.join([error.__class__.__name__, str(error)]).strip(': ')
+                jobs.error(self.target.table_name, self._job_key(key), error_message=error_message)
+            if not suppress_errors or isinstance(error, SystemExit):
+                raise
+            else:
+                logger.error(error)
+                return key, error
+        else:
+            self.connection.commit_transaction()
+            if jobs is not None and not reserved:
+                jobs.complete(self.target.table_name, self._job_key(key))
+        return None
+
     def progress(self, *restrictions, display=True):
         """
         report progress of populating this table
@@ -156,3 +366,37 @@ class AutoPopulate:
                       total - remaining, total, 100 - 100 * remaining / (total+1e-12),
                       datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S')), flush=True)
         return remaining, total
+
+
+# --- functions executed in the worker processes of populate(processes=n) ---
+
+def _initialize_populate(table, jobs, suppress_errors, batch_size, heartbeat_interval):
+    """
+    Initializes a worker process: stores the populate arguments.
+    The SIGTERM handler inherited from populate is replaced by the default handler so that terminating the pool
+    does not record the jobs in progress as errors.
+    Nothing that can fail is done here since the pool replaces a worker whose initializer raises indefinitely.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    process = mp.current_process()
+    process.table = table
+    process.jobs = jobs
+    process.suppress_errors = suppress_errors
+    process.batch_size = batch_size
+    process.heartbeat_interval = heartbeat_interval
+    process.connected = False
+
+
+def _call_populate_chunk(keys):
+    """
+    Populates a list of keys in a worker process. The first call opens the worker's dedicated connection
+    and starts sending heartbeats for the jobs reserved by the worker.
+    :return: list of (key, error) tuples for suppressed errors
+    """
+    process = mp.current_process()
+    if not process.connected:
+        process.table.connection.connect()
+        process.connected = True
+        if process.heartbeat_interval is not None:
+            Heartbeat(process.jobs, process.heartbeat_interval).start()   # stops with the worker process
+    return process.table._populate_chunk(keys, process.jobs, process.suppress_errors, process.batch_size)
@@ -1,7 +1,9 @@
 import collections
 import itertools
 import inspect
+import os
 import platform
+import tempfile
 import numpy as np
 import pymysql
 import logging
@@ -11,6 +13,7 @@ from .relational_operand import RelationalOperand
 from .blob import pack
 from .utils import user_choice
 from .heading import Heading
+from .instrumentation import operation
 from .settings import server_error_codes
 from . import __version__ as version
 
@@ -28,6 +31,9 @@ class BaseRelation(RelationalOperand):
     _context = None
     database = None
     _log_ = None
+    # compression codec of the blobs of the table (see blob.parse_codec) or a dict of codecs per blob attribute.
+    # Blobs without a codec use config['blob.compression'].
+    blob_compression = None
 
     # -------------- required by RelationalOperand ----------------- #
     @property
@@ -57,6 +63,8 @@ class BaseRelation(RelationalOperand):
             if error.args[0] == server_error_codes['command denied']:
                 logger.warning(error.args[1])
         else:
+            self.connection.heading_cache.invalidate(self.database, self.table_name)
+            self.connection.invalidate_dependencies()
             self._log('Declared ' + self.full_table_name)
 
     @property
@@ -95,6 +103,8 @@ class BaseRelation(RelationalOperand):
         """
         :return: True is the table is declared in the database
         """
+        if self.connection.heading_cache.has_table(self.database, self.table_name):
+            return True
         return self.connection.query(
             'SHOW TABLES in `{database}` LIKE "{table_name}"'.format(
                 database=self.database, table_name=self.table_name)).rowcount > 0
@@ -112,59 +122,28 @@ class BaseRelation(RelationalOperand):
             self._log_ = Log(self.connection, database=self.database)
         return self._log_
 
-    def insert1(self, row, **kwargs):
+    def _blob_codec(self, name):
         """
-        Insert one data record or one Mapping (like a dict).
-        :param row: a numpy record, a dict-like object, or an ordered sequence to be inserted as one row.
-        For kwargs, see insert()
+        :param name: name of a blob attribute
+        :return: the compression codec of the attribute: from blob_compression or else config['blob.compression']
         """
-        self.insert((row,), **kwargs)
+        codec = self.blob_compression
+        if isinstance(codec, collections.abc.Mapping):
+            codec = codec.get(name)
+        return True if codec is None else codec
 
-    def insert(self, rows, replace=False, ignore_errors=False, skip_duplicates=False, ignore_extra_fields=False):
+    def _rows_to_insert(self, rows, ignore_extra_fields=False):
         """
-        Insert a collection of rows.
-
-        :param rows: An iterable where an element is a numpy record, a dict-like object, or an ordered sequence.
-            rows may also be another relation with the same heading.
-        :param replace: If True, replaces the existing tuple.
-        :param ignore_errors: If True, ignore errors: e.g. constraint violations.
-        :param skip_duplicates: If True, silently skip duplicate inserts.
+        Converts the rows given to insert into a generator of dicts with fields 'names', 'placeholders', 'values'.
+        All dicts list the same attributes in the same order. Blobs are packed and numeric NaNs are turned into NULLs.
+        :param rows: see insert()
         :param ignore_extra_fields: If False, fields that are not in the heading raise error.
-
-        Example::
-        >>> relation.insert([
-        >>>     dict(subject_id=7, species="mouse", date_of_birth="2014-09-01"),
-        >>>     dict(subject_id=8, species="mouse", date_of_birth="2014-09-02")])
+        :return: the generator or None if the table heading cannot be accessed
         """
-
-        if isinstance(rows, RelationalOperand):
-            # INSERT FROM SELECT - build alternate field-narrowing query (only) when needed
-            if ignore_extra_fields and not all(name in self.heading.names for name in rows.heading.names):
-                query = 'INSERT{ignore} INTO {table} ({fields}) SELECT {fields} FROM ({select}) as `__alias`'.format(
-                ignore=" IGNORE" if ignore_errors or skip_duplicates else "",
-                table=self.full_table_name,
-                fields='`'+'`,`'.join(self.heading.names)+'`',
-                select=rows.make_sql())
-            else:
-                query = 'INSERT{ignore} INTO {table} ({fields}) {select}'.format(
-                ignore=" IGNORE" if ignore_errors or skip_duplicates else "",
-                table=self.full_table_name,
-                fields='`'+'`,`'.join(rows.heading.names)+'`',
-                select=rows.make_sql())
-            try:
-                self.connection.query(query)
-            except pymysql.err.InternalError as err:
-                if err.args[0] == server_error_codes['unknown column']:
-                    # args[1] -> Unknown column 'extra' in 'field list'
-                    raise DataJointError('%s : To ignore extra fields, set ignore_extra_fields=True in insert.' % err.args[1])
-                else:
-                    raise
-            return
-
         heading = self.heading
         if heading.attributes is None:
             logger.warning('Could not access table {table}'.format(table=self.full_table_name))
-            return
+            return None
 
         field_list = None  # ensures that all rows have the same attributes in the same order as the first row.
 
@@ -185,7 +164,7 @@ class BaseRelation(RelationalOperand):
                 if ignore_extra_fields and name not in heading:
                     return None
                 if heading[name].is_blob:
-                    value = pack(value)
+                    value = pack(value, compress=self._blob_codec(name))
                     placeholder = '%s'
                 elif heading[name].numeric:
                     if value is None or value == '' or np.isnan(np.float(value)):  # nans are turned into NULLs
@@ -247,22 +226,256 @@ class BaseRelation(RelationalOperand):
 
             return row_to_insert
 
-        rows = list(make_row_to_insert(row) for row in rows)
-        if rows:
+        def make_columns_to_insert(columns):
+            """
+            Vectorized counterpart of make_row_to_insert for columnar input: fields are validated once and values
+            are converted one column at a time.
+            :param columns: a dict-like object mapping attribute names to equal-length sequences
+            :return: a generator of dicts with fields 'names', 'placeholders', 'values'
+            """
+            if not ignore_extra_fields:
+                for field in columns:
+                    if field not in heading:
+                        raise KeyError(u'`{0:s}` is not in the table heading'.format(field))
+            names = tuple(name for name in heading if name in columns)
+            if not names:
+                raise DataJointError('Empty tuple')
+            for name in names:
+                column = columns[name]
+                if (isinstance(column, (str, bytes, collections.abc.Mapping)) or not hasattr(column, '__len__') or
+                        isinstance(column, np.ndarray) and column.ndim == 0):
+                    raise DataJointError('A dict passed to insert must map attributes to sequences of values, '
+                                         'but `{name}` is a single value. Use insert1 to insert one row.'.format(
+                                             name=name))
+            if len(set(len(columns[name]) for name in names)) > 1:
+                raise DataJointError('Attempt to insert columns of different lengths')
+
+            values, nullable = [], False
+            for name in names:
+                column = columns[name]
+                if heading[name].is_blob:
+                    codec = self._blob_codec(name)
+                    values.append([pack(value, compress=codec) for value in column])
+                    continue
+                column = np.asarray(column)
+                null = None
+                if heading[name].numeric:
+                    if column.dtype.kind == 'b':
+                        column = column.astype(np.int64)
+                    elif column.dtype.kind == 'f':
+                        null = np.isnan(column)
+                    elif column.dtype.kind not in 'iu':
+                        null = np.fromiter((value is None or value == '' or np.isnan(np.float(value))
+                                            for value in column), dtype=bool, count=len(column))
+                elif column.dtype.kind == 'M':
+                    column = column.astype('datetime64[us]')  # converts to datetime.datetime
+                column = column.tolist()
+                if null is not None and null.any():  # nans are turned into NULLs
+                    column = [None if is_null else value for value, is_null in zip(column, null.tolist())]
+                # None and NaT are inserted as NULL since None values are not passed as arguments to the query
+                nullable = nullable or any(value is None for value in column)
+                values.append(column)
+
+            placeholders = ('%s',) * len(names)
+            for row in zip(*values):
+                yield dict(names=names, values=row,
+                           placeholders=tuple('NULL' if value is None else '%s' for value in row)
+                           if nullable else placeholders)
+
+        if isinstance(rows, np.ndarray) and rows.dtype.fields:  # structured array: insert column by column
+            return make_columns_to_insert({name: rows[name] for name in rows.dtype.names})
+        elif isinstance(rows, collections.abc.Mapping):  # columnar dict: {attribute: sequence of values}
+            return make_columns_to_insert(rows)
+        else:
+            return (make_row_to_insert(row) for row in rows)
+
+    def insert1(self, row, **kwargs):
+        """
+        Insert one data record or one Mapping (like a dict).
+        :param row: a numpy record, a dict-like object, or an ordered sequence to be inserted as one row.
+        For kwargs, see insert()
+        """
+        self.insert((row,), **kwargs)
+
+    @operation('insert')
+    def insert(self, rows, replace=False, ignore_errors=False, skip_duplicates=False, ignore_extra_fields=False,
+               atomic=True):
+        """
+        Insert a collection of rows.
+        Rows are sent in multi-row INSERT statements whose estimated size fits in the server's max_allowed_packet
+        (see Connection.max_allowed_packet), so rows may be produced by a generator without being held in memory.
+
+        :param rows: An iterable where an element is a numpy record, a dict-like object, or an ordered sequence.
+            rows may also be another relation with the same heading, a numpy structured array, or a dict-like object
+            mapping attribute names to equal-length sequences of values. The last two are converted column by column.
+        :param replace: If True, replaces the existing tuple.
+        :param ignore_errors: If True, ignore errors: e.g. constraint violations.
+        :param skip_duplicates: If True, silently skip duplicate inserts.
+        :param ignore_extra_fields: If False, fields that are not in the heading raise error.
+        :param atomic: If True and the rows require several statements, they are inserted in one transaction.
+            If False, each statement is committed separately.
+
+        Example::
+        >>> relation.insert([
+        >>>     dict(subject_id=7, species="mouse", date_of_birth="2014-09-01"),
+        >>>     dict(subject_id=8, species="mouse", date_of_birth="2014-09-02")])
+        """
+
+        if isinstance(rows, RelationalOperand):
+            # INSERT FROM SELECT - build alternate field-narrowing query (only) when needed
+            if ignore_extra_fields and not all(name in self.heading.names for name in rows.heading.names):
+                query = 'INSERT{ignore} INTO {table} ({fields}) SELECT {fields} FROM ({select}) as `__alias`'.format(
+                ignore=" IGNORE" if ignore_errors or skip_duplicates else "",
+                table=self.full_table_name,
+                fields='`'+'`,`'.join(self.heading.names)+'`',
+                select=rows.make_sql())
+            else:
+                query = 'INSERT{ignore} INTO {table} ({fields}) {select}'.format(
+                ignore=" IGNORE" if ignore_errors or skip_duplicates else "",
+                table=self.full_table_name,
+                fields='`'+'`,`'.join(rows.heading.names)+'`',
+                select=rows.make_sql())
+            try:
+                self.connection.query(query)
+            except pymysql.err.InternalError as err:
+                if err.args[0] == server_error_codes['unknown column']:
+                    # args[1] -> Unknown column 'extra' in 'field list'
+                    raise DataJointError('%s : To ignore extra fields, set ignore_extra_fields=True in insert.' % err.args[1])
+                else:
+                    raise
+            return
+
+        rows_to_insert = self._rows_to_insert(rows, ignore_extra_fields)
+        if rows_to_insert is None:
+            return
+
+        def insert_batch(batch):
+            """
+            :param batch: list of rows produced by _rows_to_insert to be inserted with one statement
+            """
             try:
                 self.connection.query(
                     "{command} INTO {destination}(`{fields}`) VALUES {placeholders}".format(
                         command='REPLACE' if replace else 'INSERT IGNORE' if ignore_errors or skip_duplicates else 'INSERT',
                         destination=self.from_clause,
-                        fields='`,`'.join(field_list),
-                        placeholders=','.join('(' + ','.join(row['placeholders']) + ')' for row in rows)),
-                    args=list(itertools.chain.from_iterable((v for v in r['values'] if v is not None) for r in rows)))
+                        fields='`,`'.join(batch[0]['names']),
+                        placeholders=','.join('(' + ','.join(row['placeholders']) + ')' for row in batch)),
+                    args=list(itertools.chain.from_iterable((v for v in r['values'] if v is not None) for r in batch)))
             except pymysql.err.OperationalError as err:
                 if err.args[0] == server_error_codes['command denied']:
                     raise DataJointError('Command denied:  %s' % err.args[1])
                 else:
                     raise
 
+        # Blobs may double in size when escaped, so statements are limited to half of the packet size.
+        budget = self.connection.max_allowed_packet // 2
+        batch, batch_size = [], 0
+        transaction = False  # True if a transaction was started for this insert
+        try:
+            for row in rows_to_insert:
+                row_size = sum(len(v) + 4 if isinstance(v, (str, bytes)) else 24 for v in row['values'])
+                if batch and batch_size + row_size > budget:
+                    if atomic and not transaction and not self.connection.in_transaction:
+                        self.connection.start_transaction()
+                        transaction = True
+                    insert_batch(batch)
+                    batch, batch_size = [], 0
+                batch.append(row)
+                batch_size += row_size
+            if batch:
+                insert_batch(batch)
+        except:
+            if transaction:
+                self.connection.cancel_transaction()
+            raise
+        else:
+            if transaction:
+                self.connection.commit_transaction()
+
+    @operation('insert')
+    def bulk_load(self, rows, replace=False, ignore_errors=False, skip_duplicates=False, ignore_extra_fields=False):
+        """
+        Insert a large collection of rows with LOAD DATA LOCAL INFILE, which bypasses SQL parsing and escaping of
+        values. Rows are written to a temporary tab-separated file with blobs hex-encoded, which is then loaded
+        in one transaction. The server must allow local_infile, and the connection must have been opened with
+        config['database.local_infile'] set to True.
+        Arguments have the same meaning as in insert(). Since the server reports invalid values as warnings
+        during the load, the load is rolled back if it produced any warnings other than duplicate entries.
+
+        Example::
+        >>> relation.bulk_load(dict(subject_id=np.arange(1000), weight=np.random.rand(1000)))
+        """
+        if isinstance(rows, RelationalOperand):   # INSERT FROM SELECT does not transfer data to the client
+            self.insert(rows, replace=replace, ignore_errors=ignore_errors, skip_duplicates=skip_duplicates,
+                        ignore_extra_fields=ignore_extra_fields)
+            return
+        if not self.connection.conn_info['local_infile']:
+            raise DataJointError("bulk_load requires a connection opened with config['database.local_infile'] "
+                                 "set to True")
+        rows_to_insert = self._rows_to_insert(rows, ignore_extra_fields)
+        if rows_to_insert is None:
+            return
+
+        def escape(value):
+            """
+            :return: value encoded for LOAD DATA with the default FIELDS ESCAPED BY '\\'. Strings are encoded in
+                UTF-8 and bytes are written unchanged, as insert passes them to the server.
+            """
+            if value is None:
+                return b'\\N'
+            if not isinstance(value, bytes):
+                value = str(value).encode('utf-8')
+            return value.replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n').replace(
+                b'\r', b'\\r')
+
+        def escape_blob(value):
+            return b'\\N' if value is None else value.hex().encode('ascii')
+
+        fd, filename = tempfile.mkstemp(suffix='.tsv')
+        try:
+            count, names = 0, None
+            with open(fd, 'wb') as f:
+                for row in rows_to_insert:
+                    if names is None:
+                        names = row['names']
+                        blobs = [name for name in names if self.heading[name].is_blob]
+                        converters = [escape_blob if name in blobs else escape for name in names]
+                    f.write(b'\t'.join(convert(value) for convert, value in zip(converters, row['values'])) + b'\n')
+                    count += 1
+            if not count:
+                return
+            query = ("LOAD DATA LOCAL INFILE %s{command} INTO TABLE {table} CHARACTER SET binary "
+                     "FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({fields}){assignments}").format(
+                command=' REPLACE' if replace else ' IGNORE' if ignore_errors or skip_duplicates else '',
+                table=self.full_table_name,
+                fields=','.join(('@`%s`' if name in blobs else '`%s`') % name for name in names),
+                assignments=' SET ' + ','.join('`{0}`=UNHEX(@`{0}`)'.format(name) for name in blobs) if blobs else '')
+            already_in_transaction = self.connection.in_transaction
+            if not already_in_transaction:
+                self.connection.start_transaction()
+            try:
+                loaded = self.connection.query(query, args=(filename,)).rowcount
+                # LOAD DATA LOCAL turns errors into warnings whereas insert raises them unless errors are ignored
+                if not (ignore_errors or skip_duplicates):
+                    errors = [message for level, code, message in self.connection.query('SHOW WARNINGS')
+                              if code != server_error_codes['duplicate entry']]
+                    if errors:
+                        raise DataJointError('Invalid data in {table}: {errors}'.format(
+                            table=self.full_table_name, errors='; '.join(errors)))
+                if not (replace or ignore_errors or skip_duplicates) and loaded < count:
+                    raise DataJointError('Duplicate entry: {skipped} of {count} rows are already in {table}'.format(
+                        skipped=count - loaded, count=count, table=self.full_table_name))
+            except:
+                if not already_in_transaction:
+                    self.connection.cancel_transaction()
+                raise
+            else:
+                if not already_in_transaction:
+                    self.connection.commit_transaction()
+        finally:
+            os.remove(filename)
+
+    @operation('delete')
     def delete_quick(self):
         """
         Deletes the table without cascading and without user prompt. If this table has any dependent
@@ -272,6 +485,7 @@ class BaseRelation(RelationalOperand):
         self.connection.query(query)
         self._log(query[:255])
 
+    @operation('delete')
     def delete(self):
         """
         Deletes the contents of the table and its dependent tables, recursively.
@@ -324,14 +538,17 @@ class BaseRelation(RelationalOperand):
         for table, relation in list(delete_list.items()):   # need list to force a copy
             if table.isdigit():
                 delete_list.pop(table)  # remove alias nodes from the delete list
-            else:
+            elif config['safemode']:
                 count = len(relation)
                 if count:
                     do_delete = True
-                    if config['safemode']:
-                        print(table, '(%d tuples)' % count)
+                    print(table, '(%d tuples)' % count)
                 else:
                     delete_list.pop(table)
+            elif relation:  # existence check without counting
+                do_delete = True
+            else:
+                delete_list.pop(table)
         if not do_delete:
             if config['safemode']:
                 print('Nothing to delete')
@@ -354,6 +571,8 @@ class BaseRelation(RelationalOperand):
         if self.is_declared:
             query = 'DROP TABLE %s' % self.full_table_name
             self.connection.query(query)
+            self.connection.heading_cache.invalidate(self.database, self.table_name)
+            self.connection.invalidate_dependencies()
             logger.info("Dropped table %s" % self.full_table_name)
             self._log(query[:255])
         else:
@@ -464,7 +683,7 @@ class BaseRelation(RelationalOperand):
         attr = self.heading[attrname]
 
         if attr.is_blob:
-            value = pack(value)
+            value = pack(value, compress=self._blob_codec(attrname))
             placeholder = '%s'
         elif attr.numeric:
             if value is None or np.isnan(np.float(value)):  # nans are turned into NULLs
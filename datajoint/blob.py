@@ -1,11 +1,25 @@
 """
 Provides serialization methods for numpy.ndarrays that ensure compatibility with Matlab.
+
+Two blob formats are supported, identified by the null-terminated string at the start of the (decompressed) blob:
+'mYm' is compatible with Matlab and stores arrays in Fortran order. 'dj1', the native DataJoint format, stores
+arrays in their own memory order with their numpy dtype and preserves Python None, bool, int, float, complex, str,
+bytes, list, tuple, and dict. pack writes the format selected by config['blob.format']; unpack reads both.
 """
 
 import zlib
-from collections import OrderedDict, Mapping, Iterable
+import bz2
+import time
+import ast
+from collections import OrderedDict, Mapping, Iterable, Counter
 import numpy as np
-from . import DataJointError
+from . import DataJointError, config
+from .instrumentation import compression_stats
+
+try:
+    import lzma
+except ImportError:  # pragma: no cover -- python built without liblzma
+    lzma = None
 
 mxClassID = OrderedDict((
     # see http://www.mathworks.com/help/techdoc/apiref/mxclassid.html
@@ -30,17 +44,91 @@ mxClassID = OrderedDict((
 rev_class_id = {dtype: i for i, dtype in enumerate(mxClassID.values())}
 dtype_list = list(mxClassID.values())
 
+
+
+def shuffle(data, typesize):
+    """
+    Byte-shuffle filter: groups the k-th bytes of all typesize-byte elements together, which makes numeric arrays
+    much more compressible. Trailing bytes that do not form a whole element are left in place.
+    """
+    n = len(data) // typesize * typesize
+    return np.frombuffer(data, dtype=np.uint8, count=n).reshape(-1, typesize).T.tobytes() + bytes(data[n:])
+
+
+def unshuffle(data):
+    """
+    Inverse of shuffle. The first byte of data is the typesize.
+    """
+    typesize = data[0]
+    n = (len(data) - 1) // typesize * typesize
+    return np.frombuffer(data, dtype=np.uint8, count=n, offset=1).reshape(typesize, -1).T.tobytes() + \
+        bytes(data[n + 1:])
+
+
+# Compressed and filtered blobs are stored as prefix + uint64 size of the decoded blob + encoded data.
+# Encodings may be nested, e.g. a shuffled blob compressed with zlib.
 decode_lookup = {
-    b'ZL123\0': zlib.decompress
+    b'ZL123\0': zlib.decompress,
+    b'BZ123\0': bz2.decompress,
+    b'BS123\0': unshuffle,
 }
 
+# codec name -> (prefix, function returning a compressor object with compress and flush methods for a level)
+compressors = {
+    'zlib': (b'ZL123\0', lambda level: zlib.compressobj(6 if level is None else level)),
+    'bz2': (b'BZ123\0', lambda level: bz2.BZ2Compressor(9 if level is None else level)),
+}
+
+if lzma is not None:
+    decode_lookup[b'XZ123\0'] = lzma.decompress
+    compressors['lzma'] = (b'XZ123\0', lambda level: lzma.LZMACompressor(preset=level))
+
+
+# dtype kinds whose data is byte-shuffled by the shuffle filter (numeric), up to the largest typesize in the header
+shuffle_kinds = 'biufcmM'
+max_shuffle_typesize = 255
+
+# dtype kinds whose data is tested by compressing a sample before compressing the whole blob (floating point)
+trial_kinds = 'fc'
+trial_windows = 4   # number of windows sampled from the largest array
+trial_window_size = 1 << 14   # bytes per window
+
+
+def parse_codec(spec):
+    """
+    :param spec: a compression codec: 'zlib', 'bz2', or 'lzma' optionally followed by a level, e.g. 'zlib:1', and
+        optionally preceded by the byte-shuffle filter, e.g. 'shuffle+lzma'. None, False, and 'none' mean no
+        compression.
+    :return: (shuffle, codec name, level) or None for no compression
+    """
+    if spec is None or spec is False or spec == 'none':
+        return None
+    try:
+        filtered = spec.startswith('shuffle+')
+        name, _, level = spec[len('shuffle+') if filtered else 0:].partition(':')
+        level = int(level) if level else None
+    except (AttributeError, ValueError):
+        raise DataJointError('Invalid blob compression codec %r' % (spec,)) from None
+    if name not in compressors:
+        raise DataJointError('Unknown blob compression codec %r' % (spec,))
+    return filtered, name, level
+
 
 class BlobReader:
-    def __init__(self, blob, squeeze=False, as_dict=False):
+    """
+    :param blob: the serialized blob
+    :param squeeze: if True, singleton dimensions are removed from mYm arrays and 0-d arrays become scalars
+    :param as_dict: if True, mYm structures with one element are returned as dicts
+    :param copy: if True, arrays are returned as writable copies. If False, they are read-only views of the
+        (decompressed) blob whenever their layout permits, including squeezed arrays. If None (default), arrays are
+        copied only when squeeze is True.
+    """
+    def __init__(self, blob, squeeze=False, as_dict=False, copy=None):
         self._squeeze = squeeze
         self._blob = blob
         self._pos = 0
         self._as_dict = as_dict
+        self._copy = copy
 
     @property
     def pos(self):
@@ -54,21 +142,100 @@ class BlobReader:
         self.pos = 0
 
     def decompress(self):
-        for pattern, decoder in decode_lookup.items():
-            if self._blob[self.pos:].startswith(pattern):
-                self.pos += len(pattern)
-                blob_size = self.read_value('uint64')
-                blob = decoder(self._blob[self.pos:])
-                assert len(blob) == blob_size
-                self._blob = blob
-                self._pos = 0
-                break
+        decoded = True
+        while decoded:  # encodings may be nested
+            decoded = False
+            for pattern, decoder in decode_lookup.items():
+                if self._blob.startswith(pattern, self.pos):
+                    self.pos += len(pattern)
+                    blob_size = self.read_value('uint64')
+                    blob = decoder(memoryview(self._blob)[self.pos:])
+                    assert len(blob) == blob_size
+                    self._blob = blob
+                    self._pos = 0
+                    decoded = True
+                    break
 
     def unpack(self):
         self.decompress()
         blob_format = self.read_string()
         if blob_format == 'mYm':
             return self.read_mym_data(n_bytes=-1)
+        if blob_format == 'dj1':
+            return self.read_native()
+        raise DataJointError('Unknown blob format %r' % blob_format)
+
+    def read_native(self):
+        """
+        Read an object in the native format.
+        """
+        type_id = self.read_value('c')
+        if type_id == b'N':
+            return None
+        if type_id == b'b':
+            return bool(self.read_value('uint8'))
+        if type_id == b'i':
+            return int(self.read_value('<i8'))
+        if type_id == b'I':
+            return int(self.read_bytes().decode('ascii'))
+        if type_id == b'f':
+            return float(self.read_value('<f8'))
+        if type_id == b'c':
+            return complex(self.read_value('<c16'))
+        if type_id == b's':
+            return self.read_bytes().decode('utf-8')
+        if type_id == b'y':
+            return self.read_bytes()
+        if type_id in (b'L', b'T'):
+            items = [self.read_native() for _ in range(int(self.read_value('<u8')))]
+            return items if type_id == b'L' else tuple(items)
+        if type_id == b'D':
+            return dict((self.read_native(), self.read_native()) for _ in range(int(self.read_value('<u8'))))
+        if type_id == b'A':
+            return self.read_native_array()
+        if type_id == b'O':
+            shape = self.read_shape()
+            data = np.empty(int(np.prod(shape)), dtype=object)
+            for i in range(data.size):
+                data[i] = self.read_native()
+            return data.reshape(shape)
+        if type_id == b'G':
+            dtype = self.read_dtype()
+            return dtype.type() if dtype.itemsize == 0 else self.read_value(dtype)
+        raise DataJointError('Invalid blob data type %r' % type_id)
+
+    def read_native_array(self):
+        """
+        Read an array in the native format as a view of the blob, copied only if copying was requested.
+        """
+        order = self.read_value('c')
+        dtype = self.read_dtype()
+        shape = self.read_shape()
+        n_elem = int(np.prod(shape))
+        if n_elem == 0 or dtype.itemsize == 0:
+            return np.zeros(shape, dtype=dtype)
+        data = np.frombuffer(self._blob, dtype=dtype, count=n_elem, offset=self.pos)
+        self.pos += data.nbytes
+        return self.writable(data.reshape(shape) if order == b'C' else data.reshape(shape[::-1]).T)
+
+    def read_dtype(self):
+        descr = self.read_bytes().decode('ascii')
+        return np.dtype(ast.literal_eval(descr) if descr.startswith('[') else descr)
+
+    def read_shape(self):
+        n_dims = int(self.read_value('<u8'))
+        shape = np.frombuffer(self._blob, dtype='<u8', count=n_dims, offset=self.pos)
+        self.pos += shape.nbytes
+        return tuple(int(n) for n in shape)
+
+    def read_bytes(self):
+        """
+        Read a byte string preceded by its length.
+        """
+        n_bytes = int(self.read_value('<u8'))
+        data = self._blob[self.pos:self.pos + n_bytes]
+        self.pos += n_bytes
+        return bytes(data)
 
     def read_mym_data(self, n_bytes=None):
         if n_bytes is not None:
@@ -113,7 +280,7 @@ class BlobReader:
         if not advance:
             self.pos = start
 
-        return self.squeeze(data.reshape(shape, order='F'))
+        return self.squeeze(self.writable(data.reshape(shape, order='F')))
 
     def read_structure(self, advance=True, n_bytes=None):
         start = self.pos
@@ -154,12 +321,18 @@ class BlobReader:
         """
         if not self._squeeze:
             return array
-        array = array.copy()
         array = array.squeeze()
         if array.ndim == 0:
             array = array[()]
         return array
 
+    def writable(self, array):
+        """
+        :return: the array, copied if it is a read-only view of the blob and copying was requested
+        """
+        copy = self._squeeze if self._copy is None else self._copy
+        return array.copy(order='K') if copy and not array.flags.writeable else array
+
     def read_cell_array(self, advance=True, n_bytes=None):
         start = self.pos
         n_dims = self.read_value('uint64').item()
@@ -207,64 +380,288 @@ class BlobReader:
         return str(self._blob[self.pos:])
 
 
-def pack(obj, compress=True):
-    blob = b"mYm\0"
-    blob += pack_obj(obj)
+class BlobWriter:
+    """
+    Serializes an object into the mYm format.  The header bytes and the buffers of arrays are collected as a list of
+    parts and assembled only once, by a single join or by streaming them through a zlib compressor.
+    Arrays are not copied when their memory is already in Fortran order.
+    """
+    def __init__(self):
+        self._parts = []
+        self._size = 0
+        self._dtypes = Counter()   # dtype -> number of bytes of array data with that dtype
 
-    if compress:
-        compressed = b'ZL123\0' + np.uint64(len(blob)).tostring() + zlib.compress(blob)
-        if len(compressed) < len(blob):
-            blob = compressed
+    @property
+    def size(self):
+        """number of bytes written so far"""
+        return self._size
 
-    return blob
+    def write(self, data):
+        """
+        :param data: bytes or any object that exposes a contiguous buffer such as a numpy array
+        """
+        self._parts.append(data)
+        self._size += data.nbytes if isinstance(data, np.ndarray) else len(data)
 
+    def write_value(self, value, dtype='uint64'):
+        self.write(np.array(value, dtype=dtype).tobytes())
 
-def pack_obj(obj):
-    blob = b''
-    if isinstance(obj, np.ndarray):
-        blob += pack_array(obj)
-    elif isinstance(obj, Mapping):  # TODO: check if this is a good inheritance check for dict etc.
-        blob += pack_dict(obj)
-    elif isinstance(obj, str):
-        blob += pack_array(np.array(obj, dtype=np.dtype('c')))
-    elif isinstance(obj, Iterable):
-        blob += pack_array(np.array(list(obj)))
-    elif isinstance(obj, int) or isinstance(obj, float):
-        blob += pack_array(np.array(obj))
-    else:
-        raise DataJointError("Packing object of type %s currently not supported!" % type(obj))
+    def reserve_size(self):
+        """
+        reserves the uint64 field for the size of the parts that follow.
+        :return: handle to pass to fill_size once the parts have been written.
+        """
+        self.write(b'\0' * 8)
+        return len(self._parts) - 1, self._size
+
+    def fill_size(self, handle):
+        index, start = handle
+        self._parts[index] = np.uint64(self._size - start).tobytes()
+
+    def write_obj(self, obj):
+        if isinstance(obj, np.ndarray):
+            self.write_array(obj)
+        elif isinstance(obj, Mapping):  # TODO: check if this is a good inheritance check for dict etc.
+            self.write_dict(obj)
+        elif isinstance(obj, str):
+            self.write_array(np.array(obj, dtype=np.dtype('c')))
+        elif isinstance(obj, Iterable):
+            self.write_array(np.array(list(obj)))
+        elif isinstance(obj, int) or isinstance(obj, float):
+            self.write_array(np.array(obj))
+        else:
+            raise DataJointError("Packing object of type %s currently not supported!" % type(obj))
+
+    def write_array(self, array):
+        if not isinstance(array, np.ndarray):
+            raise ValueError("argument must be a numpy array!")
+        is_complex = np.iscomplexobj(array)
+        if is_complex:
+            array, imaginary = np.real(array), np.imag(array)
+        type_number = rev_class_id.get(array.dtype)
+        if type_number is None or dtype_list[type_number] is None:
+            raise DataJointError("Type %s is ambiguous or unknown" % array.dtype)
+
+        self.write(b"A")
+        self.write_value((len(array.shape), ) + array.shape, dtype=np.uint64)
+        self.write_value(type_number, dtype=np.uint32)
+        self.write_value(is_complex, dtype=np.int32)
+        if type_number == 4:  # if dealing with character array
+            self.write(('\x00'.join(array.tobytes(order='F').decode()) + '\x00').encode())
+        else:
+            self.write(array.ravel(order='F'))  # a view when the array is already in Fortran order
+            self._dtypes[array.dtype] += array.nbytes
+        if is_complex:
+            self.write(imaginary.ravel(order='F'))
+            self._dtypes[array.dtype] += array.nbytes
 
-    return blob
+    def write_string(self, value):
+        self.write(value.encode('ascii') + b'\0')
 
+    def write_dict(self, obj):
+        """
+        Write dictionary object as a singular structure array
+        :param obj: dictionary object to serialize. The fields must be simple scalar or an array.
+        """
+        obj = OrderedDict(obj)
+        self.write(b'S')
+        self.write_value((1, 1), dtype=np.uint64)
+        self.write_value(len(obj), dtype=np.uint32)
+        # write out field names
+        for k in obj:
+            self.write_string(k)
+        for v in obj.values():
+            handle = self.reserve_size()
+            self.write_obj(v)
+            self.fill_size(handle)
+
+    def _sample(self, typesize):
+        """
+        :return: up to trial_windows windows of trial_window_size bytes, evenly spaced over the largest array
+        """
+        data = max((part for part in self._parts if isinstance(part, np.ndarray)), key=lambda part: part.nbytes)
+        data = data.reshape(-1).view(np.uint8)
+        window = trial_window_size // typesize * typesize
+        if data.size <= trial_windows * window:
+            return data.tobytes()
+        offsets = np.linspace(0, data.size - window, trial_windows).astype(int) // typesize * typesize
+        return b''.join(data[offset:offset + window] for offset in offsets)
+
+    def write_native(self, obj):
+        """
+        Write an object in the native format.
+        """
+        if obj is None:
+            self.write(b'N')
+        elif isinstance(obj, np.ndarray):
+            self.write_native_array(obj)
+        elif isinstance(obj, np.generic):
+            self.write(b'G')
+            self.write_dtype(obj.dtype)
+            self.write(obj.tobytes())
+        elif isinstance(obj, bool):
+            self.write(b'b' + bytes((obj,)))
+        elif isinstance(obj, int):
+            if -2 ** 63 <= obj < 2 ** 63:
+                self.write(b'i')
+                self.write_value(obj, dtype='<i8')
+            else:
+                self.write(b'I')
+                self.write_bytes(str(obj).encode('ascii'))
+        elif isinstance(obj, float):
+            self.write(b'f')
+            self.write_value(obj, dtype='<f8')
+        elif isinstance(obj, complex):
+            self.write(b'c')
+            self.write_value(obj, dtype='<c16')
+        elif isinstance(obj, str):
+            self.write(b's')
+            self.write_bytes(obj.encode('utf-8'))
+        elif isinstance(obj, (bytes, bytearray)):
+            self.write(b'y')
+            self.write_bytes(obj)
+        elif isinstance(obj, Mapping):
+            self.write(b'D')
+            self.write_value(len(obj), dtype='<u8')
+            for k, v in obj.items():
+                self.write_native(k)
+                self.write_native(v)
+        elif isinstance(obj, (list, tuple)):
+            self.write(b'T' if isinstance(obj, tuple) else b'L')
+            self.write_value(len(obj), dtype='<u8')
+            for item in obj:
+                self.write_native(item)
+        elif isinstance(obj, Iterable):
+            self.write_native(list(obj))
+        else:
+            raise DataJointError("Packing object of type %s currently not supported!" % type(obj))
 
-def pack_array(array):
-    if not isinstance(array, np.ndarray):
-        raise ValueError("argument must be a numpy array!")
+    def write_native_array(self, array):
+        """
+        Write an array in its own memory order. C- and Fortran-contiguous arrays are not copied.
+        """
+        if array.dtype.hasobject:
+            if array.dtype != object:
+                raise DataJointError("Structured arrays with object fields are not supported")
+            self.write(b'O')
+            self.write_shape(array.shape)
+            for item in array.ravel():
+                self.write_native(item)
+            return
+        if array.flags.c_contiguous:
+            order = b'C'
+        elif array.flags.f_contiguous:
+            order, array = b'F', array.T   # the transpose of a Fortran-ordered array is a C-ordered view
+        else:
+            order, array = b'C', np.ascontiguousarray(array)
+        self.write(b'A' + order)
+        self.write_dtype(array.dtype)
+        self.write_shape(array.shape if order == b'C' else array.shape[::-1])
+        self.write(array)
+        self._dtypes[array.dtype] += array.nbytes
+
+    def write_dtype(self, dtype):
+        self.write_bytes((dtype.str if dtype.fields is None else repr(dtype.descr)).encode('ascii'))
 
-    blob = b"A"
-    blob += np.array((len(array.shape), ) + array.shape, dtype=np.uint64).tostring()
+    def write_shape(self, shape):
+        self.write_value(len(shape), dtype='<u8')
+        self.write_value(shape, dtype='<u8')
 
-    is_complex = np.iscomplexobj(array)
-    if is_complex:
-        array, imaginary = np.real(array), np.imag(array)
+    def write_bytes(self, value):
+        self.write_value(len(value), dtype='<u8')
+        self.write(value)
+
+    def getvalue(self, compress=False):
+        """
+        :param compress: a compression codec (see parse_codec), True for config['blob.compression'], or False.
+            Blobs smaller than config['blob.compression_threshold'] are not compressed. When most of the data is
+            floating point, a sample is compressed first and the blob is not compressed if the sample does not
+            shrink below config['blob.compression_trial_ratio'] of its size. The compressed blob is returned only
+            when it is smaller than the uncompressed one. The decisions are recorded in
+            instrumentation.compression_stats.
+        :return: the serialized blob
+        """
+        codec = parse_codec(config['blob.compression'] if compress is True else compress)
+        if codec is None:
+            return b''.join(self._parts)
+        start = time.perf_counter()
+        filtered, name, level = codec
+        prefix, make_compressor = compressors[name]
+        dtype = max(self._dtypes, key=self._dtypes.get) if self._dtypes else None
+        typesize = (dtype.itemsize if filtered and dtype is not None and dtype.kind in shuffle_kinds and
+                    dtype.itemsize <= max_shuffle_typesize else 1)
+
+        def encode(parts, size):
+            if typesize > 1:
+                parts = [b'BS123\0', np.uint64(size).tobytes(), np.uint8(typesize).tobytes(),
+                         shuffle(b''.join(parts), typesize)]
+                size = sum(len(part) for part in parts)
+            compressor = make_compressor(level)
+            encoded = [prefix, np.uint64(size).tobytes()]
+            encoded.extend(compressor.compress(part) for part in parts)
+            encoded.append(compressor.flush())
+            return encoded
+
+        def trial():
+            """
+            :return: the compression ratio of a sample of the largest array
+            """
+            sample = self._sample(typesize)
+            return sum(len(part) for part in encode([sample], len(sample))) / len(sample)
+
+        blob = None
+        trial_ratio = config['blob.compression_trial_ratio']
+        if self._size < config['blob.compression_threshold']:
+            decision = 'small'
+        elif (trial_ratio and dtype is not None and dtype.kind in trial_kinds and
+              self._dtypes[dtype] > trial_windows * trial_window_size and trial() > trial_ratio):
+            decision = 'incompressible'
+        else:
+            compressed = encode(self._parts, self._size)
+            if sum(len(part) for part in compressed) < self._size:
+                decision = 'compressed'
+                blob = b''.join(compressed)
+            else:
+                decision = 'not smaller'
+        if blob is None:
+            blob = b''.join(self._parts)
+        compression_stats.record(decision, 'none' if dtype is None else dtype.name, self._size, len(blob),
+                                 time.perf_counter() - start)
+        return blob
+
+
+def pack(obj, compress=True, blob_format=None):
+    """
+    :param obj: object to serialize
+    :param compress: a compression codec (see parse_codec), True for config['blob.compression'], or False
+    :param blob_format: 'mYm' or 'dj1'. Defaults to config['blob.format']
+    :return: the serialized blob
+    """
+    blob_format = config['blob.format'] if blob_format is None else blob_format
+    writer = BlobWriter()
+    if blob_format == 'mYm':
+        writer.write(b"mYm\0")
+        writer.write_obj(obj)
+    elif blob_format == 'dj1':
+        writer.write(b"dj1\0")
+        writer.write_native(obj)
+    else:
+        raise DataJointError('Unknown blob format %r' % (blob_format,))
+    return writer.getvalue(compress=compress)
 
-    type_number = rev_class_id[array.dtype]
 
-    if dtype_list[type_number] is None:
-        raise DataJointError("Type %s is ambiguous or unknown" % array.dtype)
+def _pack_with(method, obj):
+    writer = BlobWriter()
+    getattr(writer, method)(obj)
+    return writer.getvalue()
 
-    blob += np.array(type_number, dtype=np.uint32).tostring()
 
-    blob += np.int32(is_complex).tostring()
-    if type_number == 4:  # if dealing with character array
-        blob += ('\x00'.join(array.tostring(order='F').decode()) + '\x00').encode()
-    else:
-        blob += array.tostring(order='F')
+def pack_obj(obj):
+    return _pack_with('write_obj', obj)
 
-    if is_complex:
-        blob += imaginary.tostring(order='F')
 
-    return blob
+def pack_array(array):
+    return _pack_with('write_array', array)
 
 
 def pack_string(value):
@@ -276,21 +673,7 @@ def pack_dict(obj):
     Write dictionary object as a singular structure array
     :param obj: dictionary object to serialize. The fields must be simple scalar or an array.
     """
-    obj = OrderedDict(obj)
-    blob = b'S'
-    blob += np.array((1, 1), dtype=np.uint64).tostring()
-    blob += np.array(len(obj), dtype=np.uint32).tostring()
-
-    # write out field names
-    for k in obj:
-        blob += pack_string(k)
-
-    for k, v in obj.items():
-        blob_part = pack_obj(v)
-        blob += np.array(len(blob_part), dtype=np.uint64).tostring()
-        blob += blob_part
-
-    return blob
+    return _pack_with('write_dict', obj)
 
 
 def unpack(blob, **kwargs):
@@ -0,0 +1,79 @@
+"""
+Bulk introspection of a database from information_schema.
+"""
+from collections import OrderedDict, defaultdict
+
+# information_schema.tables columns named as in the output of SHOW TABLE STATUS
+_table_status = (('table_name', 'Name'), ('engine', 'Engine'), ('version', 'Version'), ('row_format', 'Row_format'),
+                 ('table_rows', 'Rows'), ('avg_row_length', 'Avg_row_length'), ('data_length', 'Data_length'),
+                 ('max_data_length', 'Max_data_length'), ('index_length', 'Index_length'),
+                 ('data_free', 'Data_free'), ('auto_increment', 'Auto_increment'), ('create_time', 'Create_time'),
+                 ('update_time', 'Update_time'), ('check_time', 'Check_time'), ('table_collation', 'Collation'),
+                 ('checksum', 'Checksum'), ('create_options', 'Create_options'), ('table_comment', 'Comment'))
+
+# information_schema.columns columns named as in the output of SHOW FULL COLUMNS
+_full_columns = (('column_name', 'Field'), ('column_type', 'Type'), ('collation_name', 'Collation'),
+                 ('is_nullable', 'Null'), ('column_key', 'Key'), ('column_default', 'Default'), ('extra', 'Extra'),
+                 ('privileges', 'Privileges'), ('column_comment', 'Comment'))
+
+
+def _select(columns):
+    return ', '.join('{0} AS `{1}`'.format(*c) for c in columns)
+
+
+def load_keys(connection, database, table_name=None):
+    """
+    Reads the primary and foreign keys of the tables of a database from information_schema with two queries.
+    :param connection: a dj.Connection
+    :param database: name of the database
+    :param table_name: if given, only the keys of this table are read
+    :return: (primary_keys, foreign_keys) where primary_keys maps table names to lists of attributes and
+        foreign_keys maps table names to OrderedDicts of foreign keys, each a dict with fields 'attributes',
+        'referenced_table' (`database`.`table`), and 'referenced_attributes'.
+    """
+    condition, args = ('=%s AND table_name=%s', (database, table_name)) if table_name else ('=%s', (database,))
+    foreign_keys = set(connection.query(
+        'SELECT table_name, constraint_name FROM information_schema.referential_constraints '
+        'WHERE constraint_schema' + condition, args=args).fetchall())
+    primary_keys = defaultdict(list)
+    keys = defaultdict(OrderedDict)
+    for table, constraint, column, referenced_database, referenced_table, referenced_column in connection.query(
+            'SELECT table_name, constraint_name, column_name, referenced_table_schema, referenced_table_name, '
+            'referenced_column_name FROM information_schema.key_column_usage WHERE table_schema' + condition +
+            ' ORDER BY table_name, constraint_name, ordinal_position', args=args):
+        if constraint == 'PRIMARY':
+            primary_keys[table].append(column)
+        elif (table, constraint) in foreign_keys:
+            fk = keys[table].setdefault(constraint, dict(
+                attributes=[], referenced_attributes=[],
+                referenced_table='`{database}`.`{table}`'.format(database=referenced_database, table=referenced_table)))
+            fk['attributes'].append(column)
+            fk['referenced_attributes'].append(referenced_column)
+    return primary_keys, keys
+
+
+class Catalog:
+    """
+    A snapshot of the metadata of all tables of a database, read with four queries to information_schema.
+    Loading a catalog fills the connection's heading cache so that the headings of the database's tables
+    are initialized without further queries.
+
+    :param connection: a dj.Connection
+    :param database: name of the database
+    """
+
+    def __init__(self, connection, database):
+        self.database = database
+        self.tables = OrderedDict(
+            (row['Name'], row) for row in connection.query(
+                'SELECT {fields} FROM information_schema.tables WHERE table_schema=%s ORDER BY table_name'.format(
+                    fields=_select(_table_status)), args=(database,), as_dict=True))
+        self.columns = defaultdict(list)   # table_name -> rows in the format of SHOW FULL COLUMNS
+        for row in connection.query(
+                'SELECT table_name AS `table_name`, {fields} FROM information_schema.columns '
+                'WHERE table_schema=%s ORDER BY table_name, ordinal_position'.format(
+                    fields=_select(_full_columns)), args=(database,), as_dict=True):
+            self.columns[row.pop('table_name')].append(row)
+        self.primary_keys, self.foreign_keys = load_keys(connection, database)
+        for table_name, info in self.tables.items():
+            connection.heading_cache.put(database, table_name, info, self.columns[table_name])
@@ -2,7 +2,13 @@
 This module hosts the Connection class that manages the connection to the mysql database,
  and the `conn` function that provides access to a persistent connection in datajoint.
 """
+import os
 import warnings
+import weakref
+import re
+import collections
+import threading
+import time
 from contextlib import contextmanager
 import pymysql as client
 import logging
@@ -10,12 +16,16 @@ from getpass import getpass
 
 from . import config
 from . import DataJointError
-from .dependencies import Dependencies
+from .heading import HeadingCache
+from .settings import server_error_codes
 from .jobs import JobManager
+from .instrumentation import QueryEvent, QueryStats, current_operation, value_size
 from pymysql import err
 
 logger = logging.getLogger(__name__)
 
+_key_table = re.compile(r'`[^`]*`\.`~keys_[0-9a-f]+`')   # name of the temporary table of a KeyList
+
 
 def conn(host=None, user=None, password=None, init_fun=None, reset=False):
     """
@@ -24,6 +34,8 @@ def conn(host=None, user=None, password=None, init_fun=None, reset=False):
     If connection information is not provided, it is taken from config which takes the
     information from dj_local_conf.json. If the password is not specified in that file
     datajoint prompts for the password.
+    If config['connection.pool_size'] is set, the connection draws its sockets from a ConnectionPool
+    so that it can be used by several threads at once.
 
     :param host: hostname
     :param user: mysql user
@@ -40,10 +52,182 @@ def conn(host=None, user=None, password=None, init_fun=None, reset=False):
         if password is None:  # pragma: no cover
             password = getpass(prompt="Please enter DataJoint password: ")
         init_fun = init_fun if init_fun is not None else config['connection.init_function']
-        conn.connection = Connection(host, user, password, init_fun)
+        conn.connection = Connection(host, user, password, init_fun,
+                                     pool_size=config['connection.pool_size'],
+                                     pool_min_size=config['connection.pool_min_size'])
     return conn.connection
 
 
+class _Bufferable:
+    """
+    Mixin for unbuffered cursors.  When another query is issued on the connection before all rows of an
+    unbuffered result have been read, the remaining rows are first buffered on the client so that they are not lost.
+    """
+    _remaining = None
+
+    def buffer_remaining(self):
+        if self.connection is not None and self._result is not None and self._result.unbuffered_active:
+            self._remaining = collections.deque(super().fetchall())
+
+    def fetchone(self):
+        if self._remaining is None:
+            return super().fetchone()
+        return self._remaining.popleft() if self._remaining else None
+
+    def fetchmany(self, size=None):
+        if self._remaining is None:
+            return super().fetchmany(size)
+        size = min(self.arraysize if size is None else size, len(self._remaining))
+        return [self._remaining.popleft() for _ in range(size)]
+
+    def fetchall(self):
+        if self._remaining is None:
+            return super().fetchall()
+        rows, self._remaining = list(self._remaining), collections.deque()
+        return rows
+
+
+class StreamingCursor(_Bufferable, client.cursors.SSCursor):
+    pass
+
+
+class StreamingDictCursor(_Bufferable, client.cursors.SSDictCursor):
+    pass
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of connections to the database server.
+    Connections are checked out by one thread at a time and returned with checkin. Connections held by
+    threads that have ended are closed and their slots are reused.
+
+    :param conn_info: connection arguments: host, port, user, passwd, local_infile
+    :param init_fun: connection initialization function (SQL)
+    :param min_size: number of connections opened in advance
+    :param max_size: maximum number of open connections. checkout waits for a free connection beyond that.
+    :param timeout: maximum wait for a free connection in seconds. None waits indefinitely.
+    :param health_check_interval: connections idle for longer than this many seconds are pinged before checkout.
+    """
+
+    def __init__(self, conn_info, init_fun=None, min_size=1, max_size=10, timeout=None, health_check_interval=30):
+        if max_size < 1 or not 0 <= min_size <= max_size:
+            raise DataJointError('Invalid pool size: min_size={min_size}, max_size={max_size}'.format(
+                min_size=min_size, max_size=max_size))
+        self.conn_info = conn_info
+        self.init_fun = init_fun
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()   # the process that owns the sockets
+        self._lock = threading.Condition()
+        self._idle = collections.deque()   # (connection, time of checkin)
+        self._owners = dict()   # checked out connection -> owning thread
+        self._pending = 0   # connections being opened or checked outside of the lock
+        for _ in range(min_size):
+            self._idle.append((self._open(), time.monotonic()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._idle) + len(self._owners) + self._pending
+
+    def _open(self):
+        connection = client.connect(init_command=self.init_fun, **self.conn_info)
+        connection.autocommit(True)
+        return connection
+
+    def _reclaim(self):
+        """
+        Closes connections whose owning threads have ended. Their transactions, if any, are rolled back by the server.
+        """
+        for connection, thread in list(self._owners.items()):
+            if not thread.is_alive():
+                del self._owners[connection]
+                try:
+                    connection.close()
+                except client.Error:
+                    pass
+
+    def checkout(self):
+        """
+        :return: a pymysql connection for the exclusive use of the calling thread
+        :raise DataJointError: if no connection becomes available within timeout
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._lock:
+            while True:
+                self._reclaim()
+                if self._idle:
+                    connection, since = self._idle.pop()   # most recently used first
+                    break
+                if len(self._owners) + self._pending < self.max_size:
+                    connection, since = None, None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise DataJointError('No database connection became available within %g seconds' % self.timeout)
+                self._lock.wait(remaining)
+            self._pending += 1
+        try:
+            if connection is not None and time.monotonic() - since > self.health_check_interval:
+                try:
+                    connection.ping(reconnect=False)
+                except client.Error:
+                    logger.info('Replacing a pooled connection that failed the health check')
+                    connection = None
+            if connection is None:
+                connection = self._open()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if connection is not None:
+                    self._owners[connection] = threading.current_thread()
+                self._lock.notify()
+        return connection
+
+    def checkin(self, connection):
+        """
+        Returns a checked out connection to the pool.
+        """
+        with self._lock:
+            self._owners.pop(connection, None)
+            if connection.open:
+                self._idle.append((connection, time.monotonic()))
+            self._lock.notify()
+
+    def close(self):
+        """
+        Closes all connections of the pool, including those that are checked out.
+        """
+        with self._lock:
+            connections = [c for c, _ in self._idle] + list(self._owners)
+            self._idle.clear()
+            self._owners.clear()
+        for connection in connections:
+            try:
+                connection.close()
+            except client.Error:
+                pass
+
+
+class _Session:
+    """
+    The state of one database session: the pymysql connection, whether it has an open transaction,
+    and its active unbuffered cursor.
+    """
+    def __init__(self):
+        self.conn = None
+        self.in_transaction = False
+        self.stream = None   # weak reference to the active unbuffered cursor
+        self.connection_id = None
+
+
+class _ThreadSession(_Session, threading.local):
+    """
+    A separate session for each thread.
+    """
+    pass
+
+
 class Connection:
     """
     A dj.Connection object manages a connection to a database server.
@@ -55,43 +239,178 @@ class Connection:
     :param user: user name
     :param password: password
     :param init_fun: connection initialization function (SQL)
+    :param pool_size: if set, the maximum number of sockets in a ConnectionPool shared by the threads using this
+        connection. Each thread checks out its own socket on first use and keeps it until it calls release().
+        If None, all threads share one socket.
+    :param pool_min_size: the number of sockets opened in advance when pool_size is set
     """
 
-    def __init__(self, host, user, password, init_fun=None):
+    def __init__(self, host, user, password, init_fun=None, pool_size=None, pool_min_size=1):
         if ':' in host:
             host, port = host.split(':')
             port = int(port)
         else:
             port = config['database.port']
-        self.conn_info = dict(host=host, port=port, user=user, passwd=password)
+        # LOAD DATA LOCAL INFILE lets the server read any client file, so it is enabled only on request
+        self.conn_info = dict(host=host, port=port, user=user, passwd=password,
+                              local_infile=config['database.local_infile'])
         self.init_fun = init_fun
         print("Connecting {user}@{host}:{port}".format(**self.conn_info))
-        self._conn = None
+        self.pool_size = pool_size
+        self.pool_min_size = pool_min_size
+        self.pool = None
+        self._session = _Session()
+        self._max_allowed_packet = None
+        self._query_hooks = []
+        self._key_lists = weakref.WeakValueDictionary()   # temporary table name -> KeyList
+        self._key_tables = weakref.WeakKeyDictionary()   # socket -> {temporary table: table of its KeyList}
+        self._key_table_access = dict()   # database -> whether the user may create temporary tables in it
         self.connect()
-        if self.is_connected:
+        with self.checkout():   # the socket used for the check is returned to the pool
+            connected = self.is_connected
+        if connected:
             logger.info("Connected {user}@{host}:{port}".format(**self.conn_info))
-            self.connection_id = self.query('SELECT connection_id()').fetchone()[0]
         else:
             raise DataJointError('Connection failed.')
-        self._conn.autocommit(True)
-        self._in_transaction = False
+        self.heading_cache = HeadingCache(config['connection.heading_cache'],
+                                          server='{host}:{port}'.format(**self.conn_info),
+                                          ttl=config['connection.heading_cache_ttl'])
         self.jobs = JobManager(self)
         self.schemas = dict()
-        self.dependencies = Dependencies(self)
+        self._dependencies = None
 
     def __eq__(self, other):
         return self.conn_info == other.conn_info
 
     def __repr__(self):
-        connected = "connected" if self.is_connected else "disconnected"
+        with self.checkout():
+            connected = "connected" if self.is_connected else "disconnected"
         return "DataJoint connection ({connected}) {user}@{host}:{port}".format(
             connected=connected, **self.conn_info)
 
     def connect(self):
         """
         Connects to the database server.
+        A connection inherited by a forked process must be reconnected before use.
+        """
+        if self.pool_size is None:
+            self._session = _Session()
+            self._session.conn = client.connect(init_command=self.init_fun, **self.conn_info)
+            self._session.conn.autocommit(True)
+        else:
+            # the sockets of an inherited pool belong to the parent process and are abandoned without closing
+            if self.pool is not None and self.pool.pid == os.getpid():
+                self.pool.close()
+            self.pool = ConnectionPool(self.conn_info, self.init_fun,
+                                       min_size=min(self.pool_min_size, self.pool_size), max_size=self.pool_size)
+            self._session = _ThreadSession()
+
+    def close(self):
+        """
+        Closes the connection to the database server.
+        """
+        if self.pool is None:
+            self._conn.close()
+        else:
+            self.pool.close()
+            self._session = _ThreadSession()
+
+    # ---------- session state of the calling thread
+    @property
+    def _conn(self):
+        session = self._session
+        if session.conn is None and self.pool is not None:
+            session.conn = self.pool.checkout()
+        return session.conn
+
+    @property
+    def _in_transaction(self):
+        return self._session.in_transaction
+
+    @_in_transaction.setter
+    def _in_transaction(self, value):
+        self._session.in_transaction = value
+
+    @property
+    def _stream(self):
+        return self._session.stream
+
+    @_stream.setter
+    def _stream(self, value):
+        self._session.stream = value
+
+    def _buffer_stream(self):
+        """
+        Reads the rest of the unbuffered result of the calling thread's session, if any, into its cursor.
+        The server cannot execute another command before the unbuffered result is read.
+        """
+        stream = self._stream and self._stream()
+        if stream is not None:
+            stream.buffer_remaining()
+        self._stream = None
+
+    @property
+    def connection_id(self):
         """
-        self._conn = client.connect(init_command=self.init_fun, **self.conn_info)
+        :return: the server's id of the session used by the calling thread
+        """
+        session = self._session
+        if session.connection_id is None:
+            session.connection_id = self.query('SELECT connection_id()').fetchone()[0]
+        return session.connection_id
+
+    def release(self):
+        """
+        Returns the socket used by the calling thread to the pool so that other threads can use it.
+        The thread checks out a socket again on its next query. Has no effect without a pool.
+        """
+        session = self._session
+        if self.pool is None or session.conn is None:
+            return
+        if session.in_transaction:
+            raise DataJointError('Cannot release a connection with an open transaction.')
+        stream = session.stream and session.stream()
+        if stream is not None:
+            stream.buffer_remaining()
+        self.pool.checkin(session.conn)
+        session.conn, session.stream, session.connection_id = None, None, None
+
+    @contextmanager
+    def checkout(self):
+        """
+        Context manager for per-task checkout: the calling thread holds one pooled socket within the with block
+        and returns it at the end unless it already held one before.
+
+        Example:
+
+        >>> with dj.conn().checkout():
+        >>>     data = (MyTable() & key).fetch()
+        """
+        held = self.pool is None or self._session.conn is not None
+        try:
+            yield self
+        finally:
+            if not held:
+                self.release()
+
+    @property
+    def dependencies(self):
+        """
+        :return: the graph of dependencies between the tables of the registered schemas.
+            It is created on first use since it imports networkx.
+        """
+        if self._dependencies is None:
+            from .dependencies import Dependencies
+            self._dependencies = Dependencies(self)
+        return self._dependencies
+
+    def invalidate_dependencies(self):
+        """
+        Causes the graph of dependencies to be rebuilt on next use. Called when tables are declared or dropped.
+        Does nothing if the graph has not been created so that networkx is not imported.
+        """
+        if self._dependencies is not None:
+            self._dependencies.invalidate()
 
     def register(self, schema):
         self.schemas[schema.database] = schema
@@ -101,9 +420,10 @@ class Connection:
         """
         Returns true if the object is connected to the database server.
         """
+        self._buffer_stream()
         return self._conn.ping()
 
-    def query(self, query, args=(), as_dict=False):
+    def query(self, query, args=(), as_dict=False, unbuffered=False):
         """
         Execute the specified query and return the tuple generator (cursor).
 
@@ -111,11 +431,21 @@ class Connection:
         :param args: additional arguments for the client.cursor
         :param as_dict: If as_dict is set to True, the returned cursor objects returns
                         query results as dictionary.
+        :param unbuffered: If True, the returned cursor reads rows from the server as they are fetched
+                        rather than downloading the entire result first.
         """
+        self._buffer_stream()
+        sql = query
+        if self._key_lists and '`~keys_' in sql:
+            query = self._create_key_tables(sql)
 
-        cursor = client.cursors.DictCursor if as_dict else client.cursors.Cursor
+        if unbuffered:
+            cursor = StreamingDictCursor if as_dict else StreamingCursor
+        else:
+            cursor = client.cursors.DictCursor if as_dict else client.cursors.Cursor
         cur = self._conn.cursor(cursor=cursor)
 
+        start = time.perf_counter()
         try:
             # Log the query
             logger.debug("Executing SQL:" + query[0:300])
@@ -129,7 +459,14 @@ class Connection:
                     Reconnected to the server. Data from transactions might be lost and referential constraints may
                     be violated. You can switch off this behavior by setting the 'database.reconnect' to False.
                     ''')
-                self.connect()
+                if self.pool is None:
+                    self.connect()
+                else:   # replace only the socket of the calling thread
+                    self.pool.checkin(self._session.conn)
+                    self._session.__init__()
+                if self._key_lists and '`~keys_' in sql:
+                    query = self._create_key_tables(sql)
+                cur = self._conn.cursor(cursor=cursor)
                 logger.debug("Re-executing SQL: " + query[0:300])
                 cur.execute(query, args)
             else:
@@ -138,8 +475,138 @@ class Connection:
             print('Error in query:')
             print(query)
             raise
+        if self._query_hooks:
+            self._report(query, args, cur, time.perf_counter() - start, unbuffered)
+        if unbuffered:
+            self._stream = weakref.ref(cur)
         return cur
 
+    # ---------- temporary tables for restrictions by large collections of keys
+    def register_key_list(self, keys):
+        """
+        :param keys: a KeyList whose temporary table is created in each session in which a query refers to it
+        """
+        self._key_lists[keys.full_table_name] = keys
+
+    def can_create_key_tables(self, database):
+        """
+        :return: True if the user has the privilege to create temporary tables in the database. Checked once.
+        """
+        if database not in self._key_table_access:
+            table = '`{database}`.`~keys_check`'.format(database=database)
+            try:
+                self.query('CREATE TEMPORARY TABLE IF NOT EXISTS {table} (`x` int)'.format(table=table))
+            except err.OperationalError as error:
+                if error.args[0] not in (server_error_codes['database access denied'],
+                                         server_error_codes['command denied']):
+                    raise
+                logger.info('Restrictions by keys are not uploaded to temporary tables in `{database}`: {error}'.format(
+                    database=database, error=error.args[1]))
+                self._key_table_access[database] = False
+            else:
+                self.query('DROP TEMPORARY TABLE IF EXISTS ' + table)
+                self._key_table_access[database] = True
+        return self._key_table_access[database]
+
+    def _create_key_tables(self, query):
+        """
+        Creates the temporary tables of the KeyLists referenced by the query in the session of the calling thread.
+        MySQL cannot refer to a temporary table more than once in a query, so repeated references are renamed
+        to copies of the table. Tables of KeyLists that no longer exist are dropped.
+        :return: the query with repeated references renamed
+        """
+        created = self._key_tables.setdefault(self._conn, dict())
+        references = collections.Counter()
+
+        def rename(match):
+            name = match.group()
+            references[name] += 1
+            return name if references[name] == 1 else name[:-1] + '_%d`' % (references[name] - 1)
+
+        query = _key_table.sub(rename, query)
+        for name, count in references.items():
+            keys = self._key_lists.get(name)
+            if keys is None:
+                continue
+            for table in [name] + [name[:-1] + '_%d`' % k for k in range(1, count)]:
+                if table in created:
+                    continue
+                stale = [t for t, source in created.items() if source not in self._key_lists]
+                for t in stale:
+                    del created[t]
+                if stale:
+                    self.query('DROP TEMPORARY TABLE IF EXISTS ' + ', '.join(stale))
+                created[table] = name
+                try:
+                    if table == name:
+                        keys.upload(self)
+                    else:
+                        self.query('CREATE TEMPORARY TABLE IF NOT EXISTS {copy} LIKE {name}'.format(
+                            copy=table, name=name))
+                        self.query('INSERT IGNORE INTO {copy} SELECT * FROM {name}'.format(copy=table, name=name))
+                except:
+                    created.pop(table, None)
+                    raise
+        return query
+
+    # ---------- instrumentation
+    def add_query_hook(self, hook):
+        """
+        :param hook: a function to be called with a QueryEvent after each query executed by this connection
+        """
+        self._query_hooks.append(hook)
+
+    def remove_query_hook(self, hook):
+        self._query_hooks.remove(hook)
+
+    @contextmanager
+    def collect_stats(self):
+        """
+        Context manager that aggregates the queries issued within the with block.
+
+        Example:
+
+        >>> with dj.conn().collect_stats() as stats:
+        >>>     MyTable().populate()
+        >>> print(stats.report(10))
+        """
+        stats = QueryStats()
+        self.add_query_hook(stats)
+        try:
+            yield stats
+        finally:
+            self.remove_query_hook(stats)
+
+    def _report(self, query, args, cur, duration, unbuffered):
+        """
+        Passes a QueryEvent describing an executed query to the query hooks.
+        """
+        rows, received = None, 0
+        if not unbuffered:
+            rows = cur.rowcount
+            if cur.description is not None:
+                result = cur.fetchall()
+                cur.scroll(0, mode='absolute')
+                received = sum(value_size(v) for row in result
+                               for v in (row.values() if isinstance(row, dict) else row))
+        args = args.values() if isinstance(args, collections.abc.Mapping) else args or ()
+        event = QueryEvent(sql=query, operation=current_operation(), duration=duration, rows=rows,
+                           bytes_sent=len(query) + sum(value_size(v) for v in args), bytes_received=received)
+        for hook in list(self._query_hooks):
+            hook(event)
+
+    @property
+    def max_allowed_packet(self):
+        """
+        :return: the maximum size of a query in bytes: config['database.max_allowed_packet'] if set,
+            otherwise the server's max_allowed_packet.
+        """
+        if config['database.max_allowed_packet'] is not None:
+            return config['database.max_allowed_packet']
+        if self._max_allowed_packet is None:
+            self._max_allowed_packet = int(self.query('SELECT @@max_allowed_packet').fetchone()[0])
+        return self._max_allowed_packet
+
     def get_user(self):
         """
         :return: the user name and host name provided by the client to the server.
@@ -174,6 +641,7 @@ class Connection:
         """
         self.query('ROLLBACK')
         self._in_transaction = False
+        self._key_tables.pop(self._conn, None)   # rows inserted into temporary tables were rolled back
         logger.info("Transaction cancelled. Rolling back ...")
 
     def commit_transaction(self):
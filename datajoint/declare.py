@@ -3,7 +3,7 @@ This module hosts functions to convert DataJoint table definitions into mysql ta
 declare the corresponding mysql tables.
 """
 import re
-import pyparsing as pp
+import functools
 import logging
 
 from . import DataJointError
@@ -11,7 +11,9 @@ from . import DataJointError
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
 def build_foreign_key_parser():
+    import pyparsing as pp
     left = pp.Literal('(').suppress()
     right = pp.Literal(')').suppress()
     attribute_name = pp.Word(pp.srange('[a-z]'), pp.srange('[a-z0-9_]'))
@@ -26,7 +28,9 @@ def build_foreign_key_parser():
     return new_attrs + arrow + options + ref_table + ref_attrs
 
 
+@functools.lru_cache(maxsize=None)
 def build_attribute_parser():
+    import pyparsing as pp
     quoted = pp.Or(pp.QuotedString('"'), pp.QuotedString("'"))
     colon = pp.Literal(':').suppress()
     attribute_name = pp.Word(pp.srange('[a-z]'), pp.srange('[a-z0-9_]')).setResultsName('name')
@@ -36,10 +40,6 @@ def build_attribute_parser():
     return attribute_name + pp.Optional(default) + colon + data_type + comment
 
 
-foreign_key_parser = build_foreign_key_parser()
-attribute_parser = build_attribute_parser()
-
-
 def is_foreign_key(line):
     """
     :param line: a line from the table definition
@@ -59,9 +59,10 @@ def compile_foreign_key(line, context, attributes, primary_key, attr_sql, foreig
     :param attr_sql: a list of sql statements defining attributes -- to be updated by this function.
     :param foreign_key_sql: a list of sql statements specifying foreign key constraints -- to be updated by this function.
     """
+    import pyparsing as pp
     from .base_relation import BaseRelation
     try:
-        result = foreign_key_parser.parseString(line)
+        result = build_foreign_key_parser().parseString(line)
     except pp.ParseException as err:
         raise DataJointError('Parsing error in line "%s". %s.' % line, err)
     try:
@@ -153,8 +154,9 @@ def compile_attribute(line, in_key=False):
     :returns: (name, sql) -- attribute name and sql code for its declaration
     """
 
+    import pyparsing as pp
     try:
-        match = attribute_parser.parseString(line+'#', parseAll=True)
+        match = build_attribute_parser().parseString(line+'#', parseAll=True)
     except pp.ParseException as err:
         raise DataJointError('Declaration error in position {pos} in line:\n  {line}\n{msg}'.format(
             line=err.args[0], pos=err.args[1], msg=err.args[2]))
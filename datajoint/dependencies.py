@@ -1,37 +1,48 @@
-import pyparsing as pp
 import networkx as nx
 import itertools
 from . import DataJointError
+from .instrumentation import operation
+from .catalog import Catalog, load_keys
 
 
 class Dependencies(nx.DiGraph):
     """
     The graph of dependencies (foreign keys) between loaded tables.
+    The graph is built from information_schema and reused by subsequent loads until it is invalidated by declaring
+    or dropping tables through DataJoint or until the number or the latest create_time of the tables of a loaded
+    database changes.
     """
-    __primary_key_parser = (pp.CaselessLiteral('PRIMARY KEY') +
-                            pp.QuotedString('(', endQuoteChar=')').setResultsName('primary_key'))
 
     def __init__(self, connection):
         self._conn = connection
         self.loaded_tables = set()
         self._node_alias_count = itertools.count()
+        self._signatures = dict()   # database -> (number of tables, latest create_time) when the database was loaded
+        self._valid = True
         super().__init__(self)
 
-    @staticmethod
-    def __foreign_key_parser(database):
-        def paste_database(unused1, unused2, toc):
-            return ['`{database}`.`{table}`'.format(database=database, table=toc[0])]
+    def invalidate(self):
+        """
+        Causes the graph to be rebuilt by the next load. Called when tables are declared or dropped.
+        """
+        self._valid = False
+
+    def _reset(self):
+        self.clear()
+        self.loaded_tables.clear()
+        self._signatures.clear()
+        self._valid = True
 
-        return (pp.CaselessLiteral('CONSTRAINT').suppress() +
-                pp.QuotedString('`').suppress() +
-                pp.CaselessLiteral('FOREIGN KEY').suppress() +
-                pp.QuotedString('(', endQuoteChar=')').setResultsName('attributes') +
-                pp.CaselessLiteral('REFERENCES') +
-                pp.Or([
-                    pp.QuotedString('`').setParseAction(paste_database),
-                    pp.Combine(pp.QuotedString('`', unquoteResults=False) + '.' +
-                               pp.QuotedString('`', unquoteResults=False))]).setResultsName('referenced_table') +
-                pp.QuotedString('(', endQuoteChar=')').setResultsName('referenced_attributes'))
+    def _read_signatures(self, databases):
+        """
+        :return: dict mapping each database to the number and the latest create_time of its tables
+        """
+        if not databases:
+            return {}
+        return {row[0]: row[1:] for row in self._conn.query(
+            'SELECT table_schema, count(*), max(create_time) FROM information_schema.tables '
+            'WHERE table_schema IN ({placeholders}) GROUP BY table_schema'.format(
+                placeholders=','.join(['%s'] * len(databases))), args=list(databases))}
 
     def add_table(self, table_name):
         """
@@ -40,55 +51,70 @@ class Dependencies(nx.DiGraph):
         """
         if table_name in self.loaded_tables:
             return
-        fk_parser = self.__foreign_key_parser(table_name.split('.')[0].strip('`'))
+        database, table = (s.strip('`') for s in table_name.split('.'))
+        primary_keys, foreign_keys = load_keys(self._conn, database, table)
         self.loaded_tables.add(table_name)
         self.add_node(table_name)
-        create_statement = self._conn.query('SHOW CREATE TABLE %s' % table_name).fetchone()[1].split('\n')
-        primary_key = None
-        for line in create_statement:
-            if primary_key is None:
-                try:
-                    result = self.__primary_key_parser.parseString(line)
-                except pp.ParseException:
-                    pass
-                else:
-                    primary_key = [s.strip(' `') for s in result.primary_key.split(',')]
-            try:
-                result = fk_parser.parseString(line)
-            except pp.ParseException:
-                pass
-            else:
-                referencing_attributes = [r.strip('` ') for r in result.attributes.split(',')]
-                referenced_attributes = [r.strip('` ') for r in result.referenced_attributes.split(',')]
-                props = dict(
-                    primary=all(a in primary_key for a in referencing_attributes),
-                    referencing_attributes=referencing_attributes,
-                    referenced_attributes=referenced_attributes,
-                    aliased=not all(a == b for a, b in zip(referencing_attributes, referenced_attributes)),
-                    multi=not all(a in referencing_attributes for a in primary_key))
-                if not props['aliased']:
-                    self.add_edge(result.referenced_table, table_name, **props)
-                else:
-                    # for aliased dependencies, add an extra node in the format '1', '2', etc
-                    alias_node = '%d' % next(self._node_alias_count)
-                    self.add_node(alias_node)
-                    self.add_edge(result.referenced_table, alias_node, **props)
-                    self.add_edge(alias_node, table_name, **props)
+        for fk in foreign_keys[table].values():
+            self._add_foreign_key(table_name, primary_keys[table], fk['attributes'],
+                                  fk['referenced_table'], fk['referenced_attributes'])
+
+    def add_catalog(self, catalog):
+        """
+        Adds the tables of a database to the dependency graph from its catalog without further queries.
+        Service tables (starting with ~) are excluded.
+        :param catalog: a Catalog of the database
+        """
+        for table in catalog.tables:
+            table_name = '`{db}`.`{tab}`'.format(db=catalog.database, tab=table)
+            if table.startswith('~') or table_name in self.loaded_tables:
+                continue
+            self.loaded_tables.add(table_name)
+            self.add_node(table_name)
+            for fk in catalog.foreign_keys[table].values():
+                self._add_foreign_key(table_name, catalog.primary_keys[table], fk['attributes'],
+                                      fk['referenced_table'], fk['referenced_attributes'])
+
+    def _add_foreign_key(self, table_name, primary_key, referencing_attributes, referenced_table,
+                         referenced_attributes):
+        """
+        Adds the edge for a foreign key of table_name
+        """
+        props = dict(
+            primary=all(a in primary_key for a in referencing_attributes),
+            referencing_attributes=referencing_attributes,
+            referenced_attributes=referenced_attributes,
+            aliased=not all(a == b for a, b in zip(referencing_attributes, referenced_attributes)),
+            multi=not all(a in referencing_attributes for a in primary_key))
+        if not props['aliased']:
+            self.add_edge(referenced_table, table_name, **props)
+        else:
+            # for aliased dependencies, add an extra node in the format '1', '2', etc
+            alias_node = '%d' % next(self._node_alias_count)
+            self.add_node(alias_node)
+            self.add_edge(referenced_table, alias_node, **props)
+            self.add_edge(alias_node, table_name, **props)
 
+    @operation('dependencies')
     def load(self, target=None):
         """
         Load dependencies for all loaded schemas.
         This method gets called before any operation that requires dependencies: delete, drop, populate, progress.
+        Databases that are already loaded and unchanged are not read again.
         """
+        if not self._valid:
+            self._reset()
         if target is not None and '.' in target:  # `database`.`table`
             self.add_table(target)
         else:
-            databases = self._conn.schemas if target is None else [target]
-            for database in databases:
-                for row in self._conn.query('SHOW TABLES FROM `{database}`'.format(database=database)):
-                    table = row[0]
-                    if not table.startswith('~'):  # exclude service tables
-                        self.add_table('`{db}`.`{tab}`'.format(db=database, tab=table))
+            databases = set(self._conn.schemas if target is None else [target])
+            signatures = self._read_signatures(databases | set(self._signatures))
+            if any(signatures.get(database) != signature for database, signature in self._signatures.items()):
+                databases |= set(self._signatures)
+                self._reset()
+            for database in databases - set(self._signatures):
+                self.add_catalog(Catalog(self._conn, database))
+                self._signatures[database] = signatures.get(database)
         if not nx.is_directed_acyclic_graph(self):  # pragma: no cover
             raise DataJointError('DataJoint can only work with acyclic dependencies')
 
@@ -1,17 +1,49 @@
 from collections import OrderedDict
 from collections.abc import Callable, Iterable
 from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from .blob import unpack
-from . import DataJointError
+from . import DataJointError, config
 from . import key as PRIMARY_KEY
+from .instrumentation import operation
 import warnings
 
+ITER_CHUNK_SIZE = 100   # number of rows read from the server at a time while iterating
+COLUMNS_CHUNK_SIZE = 10000   # number of rows read from the server at a time by fetch(format='columns')
+
 
 def update_dict(d1, d2):
     return {k: (d2[k] if k in d2 else d1[k]) for k in d1}
 
 
+def unpack_threads(ext_behavior):
+    """
+    :return: the number of threads for unpacking blobs requested by the fetch behavior or by config
+    """
+    threads = ext_behavior['unpack_threads']
+    return config['fetch.unpack_threads'] if threads is None else threads
+
+
+@contextmanager
+def _no_executor():
+    yield None
+
+
+def unpack_cells(cells, unpack_, executor=None):
+    """
+    Unpacks a list of blobs, concurrently if an executor is provided.  The order of the results is preserved.
+    :param cells: list of packed blobs
+    :param unpack_: the unpack function
+    :param executor: a concurrent.futures.Executor or None
+    :return: list of unpacked values
+    """
+    if executor is None or len(cells) < 2:
+        return list(map(unpack_, cells))
+    return list(executor.map(unpack_, cells))
+
+
 class FetchBase:
     def __init__(self, arg):
         # prepare copy constructor
@@ -36,7 +68,7 @@ class FetchBase:
 
     def _initialize_behavior(self):
         self.sql_behavior = {}
-        self.ext_behavior = dict(squeeze=False)
+        self.ext_behavior = dict(squeeze=False, unpack_threads=None, format='array', copy=None)
 
     @property
     def squeeze(self):
@@ -156,6 +188,7 @@ class Fetch(FetchBase, Callable, Iterable):
         ret.sql_behavior['offset'] = offset
         return ret
 
+    @operation('fetch')
     def __call__(self, *attrs, **kwargs):
         """
         Fetches the relation from the database table into an np.array and unpacks blob attributes.
@@ -166,6 +199,12 @@ class Fetch(FetchBase, Callable, Iterable):
         :param limit: the maximum number of tuples to return
         :param order_by: the list of attributes to order the results. No ordering should be assumed if order_by=None.
         :param as_dict: returns a list of dictionaries instead of a record array
+        :param unpack_threads: number of threads for unpacking blobs. Defaults to config['fetch.unpack_threads']
+        :param format: 'array' returns a structured numpy.array.  'columns' returns an OrderedDict of numpy arrays,
+            one per attribute, which avoids holding the rows as python tuples.
+        :param copy: if True, arrays in blobs are returned as writable copies. If False, they are read-only views
+            of the fetched (and decompressed) data whenever their layout permits. If None (default), only squeezed
+            arrays are copied.
         :return: the contents of the relation in the form of a structured numpy.array
         """
         # if 'order_by' passed in a string, make into list
@@ -177,7 +216,13 @@ class Fetch(FetchBase, Callable, Iterable):
         total_behavior = dict(sql_behavior)
         total_behavior.update(ext_behavior)
 
-        unpack_ = partial(unpack, squeeze=ext_behavior['squeeze'])
+        unpack_ = partial(unpack, squeeze=ext_behavior['squeeze'], copy=ext_behavior['copy'])
+
+        if ext_behavior['format'] not in ('array', 'columns'):
+            raise DataJointError("The format argument must be 'array' or 'columns'")
+        as_columns = ext_behavior['format'] == 'columns'
+        if as_columns and sql_behavior['as_dict']:
+            raise DataJointError("The format 'columns' cannot be combined with as_dict")
 
         if sql_behavior['limit'] is None and sql_behavior['offset'] is not None:
             warnings.warn('Offset set, but no limit. Setting limit to a large number. '
@@ -185,29 +230,73 @@ class Fetch(FetchBase, Callable, Iterable):
             sql_behavior['limit'] = 2 * len(self._relation)
 
         if len(attrs) == 0: # fetch all attributes
-            cur = self._relation.cursor(**sql_behavior)
             heading = self._relation.heading
-            if sql_behavior['as_dict']:
-                ret = [OrderedDict((name, unpack_(d[name]) if heading[name].is_blob else d[name])
-                                   for name in heading.names)
-                       for d in cur.fetchall()]
-            else:
-                ret = list(cur.fetchall())
-                ret = np.array(ret, dtype=heading.as_dtype)
-                for blob_name in heading.blobs:
-                    ret[blob_name] = list(map(unpack_, ret[blob_name]))
+            threads = unpack_threads(ext_behavior)
+            with ThreadPoolExecutor(threads) if threads > 1 and heading.blobs else _no_executor() as executor:
+                if as_columns:
+                    ret = self._fetch_columns(sql_behavior, unpack_, executor)
+                elif sql_behavior['as_dict']:
+                    cur = self._relation.cursor(**sql_behavior)
+                    rows = cur.fetchall()
+                    unpacked = iter(unpack_cells([d[name] for d in rows for name in heading.blobs],
+                                                 unpack_, executor))
+                    ret = [OrderedDict((name, next(unpacked) if heading[name].is_blob else d[name])
+                                       for name in heading.names)
+                           for d in rows]
+                else:
+                    cur = self._relation.cursor(**sql_behavior)
+                    ret = list(cur.fetchall())
+                    ret = np.array(ret, dtype=heading.as_dtype)
+                    for blob_name in heading.blobs:
+                        ret[blob_name] = unpack_cells(ret[blob_name], unpack_, executor)
 
         else:  # if list of attributes provided
             attributes = [a for a in attrs if a is not PRIMARY_KEY]
             result = self._relation.proj(*attributes).fetch(**total_behavior)
+            primary_key = self._relation.primary_key
             return_values = [
-                list(to_dicts(result[self._relation.primary_key]))
+                (list(dict(zip(primary_key, k)) for k in zip(*(result[a].tolist() for a in primary_key)))
+                 if as_columns else list(to_dicts(result[primary_key])))
                 if attribute is PRIMARY_KEY else result[attribute]
                 for attribute in attrs]
             ret = return_values[0] if len(attrs) == 1 else return_values
 
         return ret
 
+    def _fetch_columns(self, sql_behavior, unpack_, executor):
+        """
+        Reads the query result in chunks directly into numpy arrays, one per attribute.
+        Numeric attributes use their dtype.  Other attributes, including blobs, use object arrays.
+        :param sql_behavior: the sql behavior of the fetch
+        :param unpack_: the function to unpack blobs
+        :param executor: the executor to unpack blobs concurrently or None
+        :return: OrderedDict of numpy arrays keyed by attribute name
+        """
+        heading = self._relation.heading
+        capacity = COLUMNS_CHUNK_SIZE
+        columns = OrderedDict((name, np.empty(capacity, dtype=heading[name].dtype)) for name in heading.names)
+        count = 0
+        cur = self._relation.cursor(unbuffered=True, **sql_behavior)
+        try:
+            rows = cur.fetchmany(COLUMNS_CHUNK_SIZE)
+            while rows:
+                if count + len(rows) > capacity:
+                    capacity *= 2
+                    for column in columns.values():
+                        column.resize(capacity, refcheck=False)
+                for column, values in zip(columns.values(), zip(*rows)):
+                    column[count:count + len(rows)] = values
+                count += len(rows)
+                rows = cur.fetchmany(COLUMNS_CHUNK_SIZE)
+        finally:
+            cur.close()
+        for name, column in columns.items():
+            column.resize(count, refcheck=False)
+            if heading[name].is_blob:
+                for i, value in enumerate(unpack_cells(column.tolist(), unpack_, executor)):
+                    column[i] = value
+        return columns
+
     def __iter__(self):
         """
         Iterator that returns the contents of the database.
@@ -215,22 +304,27 @@ class Fetch(FetchBase, Callable, Iterable):
         sql_behavior = dict(self.sql_behavior)
         ext_behavior = dict(self.ext_behavior)
 
-        unpack_ = partial(unpack, squeeze=ext_behavior['squeeze'])
-
-        cur = self._relation.cursor(**sql_behavior)
+        unpack_ = partial(unpack, squeeze=ext_behavior['squeeze'], copy=ext_behavior['copy'])
 
         heading = self._relation.heading
         do_unpack = tuple(h in heading.blobs for h in heading.names)
-        values = cur.fetchone()
-        while values:
-            if sql_behavior['as_dict']:
-                yield OrderedDict(
-                    (field_name, unpack_(values[field_name])) if up
-                    else (field_name, values[field_name])
-                    for field_name, up in zip(heading.names, do_unpack))
-            else:
-                yield tuple(unpack_(value) if up else value for up, value in zip(do_unpack, values))
-            values = cur.fetchone()
+        # fields are addressed by name in dict rows and by position in tuple rows
+        fields = heading.names if sql_behavior['as_dict'] else range(len(heading.names))
+        blob_fields = [f for f, up in zip(fields, do_unpack) if up]
+        threads = unpack_threads(ext_behavior)
+        cur = self._relation.cursor(unbuffered=True, **sql_behavior)
+        try:
+            with ThreadPoolExecutor(threads) if threads > 1 and blob_fields else _no_executor() as executor:
+                rows = cur.fetchmany(ITER_CHUNK_SIZE)
+                while rows:
+                    unpacked = iter(unpack_cells([values[f] for values in rows for f in blob_fields],
+                                                 unpack_, executor))
+                    for values in rows:
+                        values = [next(unpacked) if up else values[f] for f, up in zip(fields, do_unpack)]
+                        yield OrderedDict(zip(heading.names, values)) if sql_behavior['as_dict'] else tuple(values)
+                    rows = cur.fetchmany(ITER_CHUNK_SIZE)
+        finally:
+            cur.close()
 
     def keys(self, **kwargs):
         """
@@ -283,6 +377,7 @@ class Fetch1(FetchBase, Callable):
     :param relation: relation the fetch object fetches data from
     """
 
+    @operation('fetch')
     def __call__(self, *attrs, **kwargs):
         """
         This version of fetch is called when self is expected to contain exactly one tuple.
@@ -290,7 +385,7 @@ class Fetch1(FetchBase, Callable):
         """
         heading = self._relation.heading
         ext_behavior = update_dict(self.ext_behavior, kwargs)
-        unpack_ = partial(unpack, squeeze=ext_behavior['squeeze'])
+        unpack_ = partial(unpack, squeeze=ext_behavior['squeeze'], copy=ext_behavior['copy'])
 
         if len(attrs) == 0:  # fetch all attributes
             cur = self._relation.cursor(as_dict=True)
@@ -1,8 +1,14 @@
 import numpy as np
 from collections import namedtuple, OrderedDict
 import re
+import os
+import json
+import atexit
+import datetime
+import time
 import logging
 from . import DataJointError
+from .instrumentation import operation
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +37,122 @@ class Attribute(namedtuple('_Attribute', default_attribute_properties.keys())):
             name=self.name, type=self.type, comment=self.comment)
 
 
+class HeadingCache:
+    """
+    Cache of the table metadata from which headings are initialized, shared by the relations of one connection.
+    Entries are keyed by `database`.`table_name` and remain valid while the table's create_time in
+    information_schema.tables is unchanged. The create times of a database are read with one query and reused
+    for ttl seconds so that lookups within that time issue no queries. Tables declared, altered, or dropped through
+    DataJoint are invalidated explicitly; changes made by other clients are detected once the create times expire.
+
+    :param filename: optional path of a JSON file in which the cache is persisted for later sessions
+    :param server: host:port of the server, which distinguishes the entries of different servers in the same file
+    :param ttl: seconds after which the create times of a database are read again. None = never.
+    """
+
+    def __init__(self, filename=None, server='', ttl=60):
+        self.filename = filename
+        self.server = server
+        self.ttl = ttl
+        self._entries = dict()   # `database`.`table_name` -> dict(create_time, info, columns, attributes)
+        self._create_times = dict()   # database -> {table_name: create_time}
+        self._read_times = dict()   # database -> time.monotonic() when its create times were read
+        self._others = dict()   # entries of other servers in the same file
+        self._dirty = False
+        if filename is not None:
+            self._load()
+            atexit.register(self.save)
+
+    @staticmethod
+    def _key(database, table_name):
+        return '`{database}`.`{table_name}`'.format(database=database, table_name=table_name)
+
+    def _load(self):
+        try:
+            with open(self.filename) as f:
+                contents = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning('Could not read the heading cache {file}: {error}'.format(file=self.filename, error=e))
+            return
+        self._others = {server: entries for server, entries in contents.items() if server != self.server}
+        for key, entry in contents.get(self.server, {}).items():
+            entry['info'] = {k: datetime.datetime.strptime(v, '%Y-%m-%d %H:%M:%S') if k.endswith('_time') and v else v
+                             for k, v in entry['info'].items()}
+            self._entries[key] = entry
+
+    def save(self):
+        """
+        Writes the cache to its file, if any.
+        """
+        if self.filename is None or not self._dirty:
+            return
+        entries = {key: dict(create_time=entry['create_time'], info=entry['info'], columns=entry['columns'])
+                   for key, entry in self._entries.items()}
+        temp = self.filename + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(dict(self._others, **{self.server: entries}), f, default=str)
+        os.replace(temp, self.filename)
+        self._dirty = False
+
+    def get(self, conn, database, table_name):
+        """
+        :return: the valid cache entry for the table or None
+        """
+        create_times = self._create_times.get(database)
+        if create_times is None or table_name not in create_times or self._expired(database):
+            create_times = self._create_times[database] = dict(conn.query(
+                'SELECT table_name, create_time FROM information_schema.tables WHERE table_schema=%s',
+                args=(database,)).fetchall())
+            self._read_times[database] = time.monotonic()
+        entry = self._entries.get(self._key(database, table_name))
+        if entry is not None and table_name in create_times and entry['create_time'] == str(create_times[table_name]):
+            return entry
+        return None
+
+    def put(self, database, table_name, info, columns):
+        """
+        Stores the results of SHOW TABLE STATUS and SHOW FULL COLUMNS for the table.
+        :return: the new cache entry
+        """
+        key = self._key(database, table_name)
+        entry = self._entries.get(key)
+        if entry is None or entry['create_time'] != str(info['Create_time']):
+            entry = self._entries[key] = dict(create_time=str(info['Create_time']), info=info, columns=columns)
+            self._dirty = True
+        if database not in self._create_times:
+            self._read_times[database] = time.monotonic()
+        self._create_times.setdefault(database, {})[table_name] = info['Create_time']
+        return entry
+
+    def _expired(self, database):
+        read_time = self._read_times.get(database)
+        return read_time is None or self.ttl is not None and time.monotonic() - read_time > self.ttl
+
+    def has_table(self, database, table_name):
+        """
+        :return: True if the table was present when the create times of the database were last read,
+            unless they have expired
+        """
+        return table_name in self._create_times.get(database, ()) and not self._expired(database)
+
+    def invalidate(self, database, table_name=None):
+        """
+        Removes the entry of a table or, if table_name is None, the entries of all tables of the database.
+        """
+        if table_name is None:
+            self._create_times.pop(database, None)
+            self._read_times.pop(database, None)
+            keys = [key for key in self._entries if key.startswith('`%s`.' % database)]
+        else:
+            self._create_times.get(database, {}).pop(table_name, None)
+            keys = [self._key(database, table_name)]
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+
+
 class Heading:
     """
     Local class for relations' headings.
@@ -123,26 +245,38 @@ class Heading:
     def __iter__(self):
         return iter(self.attributes)
 
+    @operation('heading')
     def init_from_database(self, conn, database, table_name):
         """
         initialize heading from a database table.  The table must exist already.
+        The table metadata are taken from the connection's heading_cache when it has a valid entry.
         """
-        info = conn.query('SHOW TABLE STATUS FROM `{database}` WHERE name="{table_name}"'.format(
-            table_name=table_name, database=database), as_dict=True).fetchone()
-        if info is None:
-            if table_name == '~log':
-                logger.warning('Could not create the ~log table')
-                return
-            else:
-                raise DataJointError('The table `{database}`.`{table_name}` is not defined.'.format(
-                    table_name=table_name, database=database))
+        cache = getattr(conn, 'heading_cache', None)
+        entry = None if cache is None else cache.get(conn, database, table_name)
+        if entry is not None and 'attributes' in entry:
+            self.table_info = {k.lower(): v for k, v in entry['info'].items()}
+            self.attributes = OrderedDict(entry['attributes'])
+            return
+        if entry is None:
+            info = conn.query('SHOW TABLE STATUS FROM `{database}` WHERE name="{table_name}"'.format(
+                table_name=table_name, database=database), as_dict=True).fetchone()
+            if info is None:
+                if table_name == '~log':
+                    logger.warning('Could not create the ~log table')
+                    return
+                else:
+                    raise DataJointError('The table `{database}`.`{table_name}` is not defined.'.format(
+                        table_name=table_name, database=database))
+            cur = conn.query(
+                'SHOW FULL COLUMNS FROM `{table_name}` IN `{database}`'.format(
+                    table_name=table_name, database=database), as_dict=True)
+            columns = cur.fetchall()
+            if cache is not None:
+                entry = cache.put(database, table_name, info, columns)
+        else:
+            info, columns = entry['info'], entry['columns']
         self.table_info = {k.lower(): v for k, v in info.items()}
-
-        cur = conn.query(
-            'SHOW FULL COLUMNS FROM `{table_name}` IN `{database}`'.format(
-                table_name=table_name, database=database), as_dict=True)
-
-        attributes = cur.fetchall()
+        attributes = columns
 
         rename_map = {
             'Field': 'name',
@@ -213,6 +347,8 @@ class Heading:
                     assert (t, is_unsigned) in numeric_types, 'dtype not found for type %s' % t
                     attr['dtype'] = numeric_types[(t, is_unsigned)]
         self.attributes = OrderedDict([(q['name'], Attribute(**q)) for q in attributes])
+        if entry is not None:
+            entry['attributes'] = self.attributes.copy()
 
     def project(self, attribute_list, named_attributes=None, force_primary_key=None):
         """
@@ -0,0 +1,186 @@
+"""
+Instrumentation of the queries issued by DataJoint.
+Connection.query reports each query to the hooks registered with Connection.add_query_hook as a QueryEvent.
+QueryStats is a hook that aggregates the events by SQL fingerprint.
+compression_stats aggregates the compression decisions of blob.pack.
+"""
+import re
+import threading
+import functools
+from collections import namedtuple, OrderedDict
+
+QueryEvent = namedtuple('QueryEvent', ('sql', 'operation', 'duration', 'rows', 'bytes_sent', 'bytes_received'))
+QueryEvent.__doc__ = """
+A query executed by Connection.query.
+sql: the query; operation: the DataJoint operations that issued it, outermost first, e.g. 'populate/fetch';
+duration: wall time of the execution in seconds; rows: rows returned or affected, None for unbuffered queries
+whose rows are read later; bytes_sent and bytes_received: approximate sizes of the query and of the returned values.
+"""
+
+_context = threading.local()
+
+
+def current_operation():
+    """
+    :return: the DataJoint operations in progress in the calling thread, joined by '/', or None
+    """
+    operations = getattr(_context, 'operations', None)
+    return '/'.join(operations) if operations else None
+
+
+def operation(name):
+    """
+    Decorator that attributes the queries issued within the decorated method to the operation `name`.
+    Nested calls to the same operation are reported once.
+    :param name: one of 'fetch', 'insert', 'delete', 'populate', 'heading', 'dependencies'
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            operations = _context.__dict__.setdefault('operations', [])
+            if operations and operations[-1] == name:
+                return func(*args, **kwargs)
+            operations.append(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                operations.pop()
+        return wrapper
+    return decorator
+
+
+def value_size(value):
+    """
+    :return: approximate number of bytes transferred for one value
+    """
+    return len(value) if isinstance(value, (str, bytes, bytearray)) else 8
+
+
+_literals = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|%s|\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_lists = re.compile(r'\((?:\s*(?:\?|NULL)\s*,)*\s*(?:\?|NULL)\s*\)')
+_rows = re.compile(r'\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+')
+_space = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    :return: the query with its literal values replaced by ? and value lists collapsed, so that queries that
+        differ only in their values have the same fingerprint.
+    """
+    sql = _literals.sub('?', sql)
+    sql = _lists.sub('(?...)', sql)
+    sql = _rows.sub('(?...)', sql)
+    return _space.sub(' ', sql).strip()
+
+
+class QueryStats:
+    """
+    A query hook that aggregates queries by fingerprint: number of calls, total time, rows, and bytes.
+
+    Example:
+
+    >>> with dj.conn().collect_stats() as stats:
+    >>>     MyTable().populate()
+    >>> print(stats.report(10))
+    """
+
+    _fields = ('calls', 'time', 'rows', 'bytes_sent', 'bytes_received')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = OrderedDict()   # fingerprint -> dict of totals
+        self.operations = OrderedDict()   # operation -> dict of totals
+
+    def __call__(self, event):
+        totals = (1, event.duration, event.rows or 0, event.bytes_sent, event.bytes_received)
+        with self._lock:
+            for key, table in ((fingerprint(event.sql), self.stats), (event.operation, self.operations)):
+                entry = table.setdefault(key, dict.fromkeys(self._fields, 0))
+                for field, value in zip(self._fields, totals):
+                    entry[field] += value
+
+    def clear(self):
+        with self._lock:
+            self.stats.clear()
+            self.operations.clear()
+
+    def top(self, n=10, by='time'):
+        """
+        :param n: number of fingerprints to return
+        :param by: the total to sort by: 'calls', 'time', 'rows', 'bytes_sent', or 'bytes_received'
+        :return: list of (fingerprint, totals) sorted in descending order of the total `by`
+        """
+        with self._lock:
+            return sorted(self.stats.items(), key=lambda item: item[1][by], reverse=True)[:n]
+
+    def report(self, n=10, by='time'):
+        """
+        :return: a printable table of the top n fingerprints and of the totals per operation
+        """
+        lines = ['{:>8} {:>10} {:>10} {:>12}  {}'.format('calls', 'time (s)', 'rows', 'bytes in', 'query')]
+        lines.extend('{calls:8d} {time:10.3f} {rows:10d} {bytes_received:12d}  {sql}'.format(
+            sql=sql[:200], **totals) for sql, totals in self.top(n, by))
+        lines.append('')
+        lines.append('{:>8} {:>10} {:>10} {:>12}  {}'.format('calls', 'time (s)', 'rows', 'bytes in', 'operation'))
+        with self._lock:
+            lines.extend('{calls:8d} {time:10.3f} {rows:10d} {bytes_received:12d}  {operation}'.format(
+                operation=operation_ or '(none)', **totals) for operation_, totals in self.operations.items())
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.report()
+
+
+class CompressionStats:
+    """
+    Totals of the compression decisions made by blob.pack, per decision and per dominant dtype of the blob data.
+    Decisions are 'small' (below config['blob.compression_threshold']), 'incompressible' (rejected by the trial
+    compression of a sample), 'compressed', and 'not smaller' (compressed but stored uncompressed).
+
+    Example:
+
+    >>> from datajoint.instrumentation import compression_stats
+    >>> compression_stats.clear()
+    >>> MyTable().insert(rows)
+    >>> print(compression_stats.report())
+    """
+
+    _fields = ('blobs', 'bytes', 'stored_bytes', 'time')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = OrderedDict()   # (decision, dtype) -> dict of totals
+
+    def record(self, decision, dtype, size, stored_size, duration):
+        """
+        :param decision: see class description
+        :param dtype: name of the dtype of most of the array data in the blob, or 'none'
+        :param size: uncompressed size in bytes
+        :param stored_size: size of the stored blob in bytes
+        :param duration: time spent deciding and compressing in seconds
+        """
+        with self._lock:
+            entry = self.stats.setdefault((decision, dtype), dict.fromkeys(self._fields, 0))
+            for field, value in zip(self._fields, (1, size, stored_size, duration)):
+                entry[field] += value
+
+    def clear(self):
+        with self._lock:
+            self.stats.clear()
+
+    def report(self):
+        """
+        :return: a printable table of the totals
+        """
+        lines = ['{:>14} {:>10} {:>8} {:>14} {:>14} {:>10}'.format(
+            'decision', 'dtype', 'blobs', 'bytes', 'stored', 'time (s)')]
+        with self._lock:
+            lines.extend('{decision:>14} {dtype:>10} {blobs:8d} {bytes:14d} {stored_bytes:14d} {time:10.3f}'.format(
+                decision=decision, dtype=dtype, **totals) for (decision, dtype), totals in self.stats.items())
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return self.report()
+
+
+compression_stats = CompressionStats()
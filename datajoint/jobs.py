@@ -1,10 +1,20 @@
 import hashlib
 import os
+import threading
+import logging
+from collections import OrderedDict
 import pymysql
+from . import DataJointError
 from .base_relation import BaseRelation
+from .declare import compile_attribute
+from .settings import server_error_codes
+
+logger = logging.getLogger(__name__)
 
 ERROR_MESSAGE_LENGTH = 2047
 TRUNCATION_APPENDIX = '...truncated'
+HEARTBEAT_ATTRIBUTE = 'heartbeat=CURRENT_TIMESTAMP  :timestamp   # last time the worker reported progress'
+HEARTBEAT_CONDITION = "WHERE status='reserved' AND connection_id=%s"
 
 
 def key_hash(key):
@@ -46,11 +56,32 @@ class JobTable(BaseRelation):
         pid=0  :int unsigned  # system process id
         connection_id = 0  : bigint unsigned          # connection_id()
         timestamp=CURRENT_TIMESTAMP  :timestamp   # automatic timestamp
-        """.format(database=database, error_message_length=ERROR_MESSAGE_LENGTH)
+        {heartbeat}
+        """.format(database=database, error_message_length=ERROR_MESSAGE_LENGTH, heartbeat=HEARTBEAT_ATTRIBUTE)
         if not self.is_declared:
             self.declare()
         self._user = self.connection.get_user()
 
+    def require_heartbeat(self):
+        """
+        Adds the heartbeat attribute to a job table declared by an earlier version of datajoint.
+        It is called only when heartbeats are used so that other uses of the table do not alter it.
+        :raise DataJointError: if the user lacks the privilege to alter the table
+        """
+        if 'heartbeat' in self.heading.names:
+            return
+        try:
+            self.connection.query('ALTER TABLE {table} ADD COLUMN {attribute}'.format(
+                table=self.full_table_name, attribute=compile_attribute(HEARTBEAT_ATTRIBUTE)[1]))
+        except pymysql.err.OperationalError as error:
+            if error.args[0] == server_error_codes['command denied']:
+                raise DataJointError('Heartbeats require the attribute `heartbeat` in {table}, which cannot be added: '
+                                     '{error}'.format(table=self.full_table_name, error=error.args[1]))
+            if error.args[0] != server_error_codes['duplicate column']:   # else added concurrently by another process
+                raise
+        self.connection.heading_cache.invalidate(self.database, self.table_name)
+        self._heading = None
+
     @property
     def definition(self):
         return self._definition
@@ -90,6 +121,42 @@ class JobTable(BaseRelation):
             return False
         return True
 
+    def reserve_batch(self, table_name, keys):
+        """
+        Reserve multiple jobs with a multi-row INSERT IGNORE.
+        Jobs that are already reserved, including by this connection, or marked as errors are skipped.
+        :param table_name: `database`.`table_name`
+        :param keys: an iterable of dicts with the jobs' primary keys
+        :return: the list of keys that were reserved by this call in their original order
+        """
+        jobs = OrderedDict((key_hash(key), key) for key in keys)
+        if not jobs:
+            return []
+        query = "SELECT key_hash FROM {table} WHERE table_name=%s{condition} AND key_hash IN ({hashes})"
+        # jobs that exist before the insert, including those already reserved by this connection, are not returned
+        existing = set(row[0] for row in self.connection.query(
+            query.format(table=self.full_table_name, condition='', hashes=','.join(['%s'] * len(jobs))),
+            args=[table_name] + list(jobs)))
+        jobs = OrderedDict((hash_, key) for hash_, key in jobs.items() if hash_ not in existing)
+        if not jobs:
+            return []
+        host, pid = os.uname().nodename, os.getpid()
+        self.insert((dict(
+            table_name=table_name,
+            key_hash=hash_,
+            status='reserved',
+            host=host,
+            pid=pid,
+            connection_id=self.connection.connection_id,
+            key=key,
+            user=self._user) for hash_, key in jobs.items()), skip_duplicates=True, ignore_extra_fields=True)
+        # jobs inserted concurrently by other connections are skipped by the insert
+        reserved = set(row[0] for row in self.connection.query(
+            query.format(table=self.full_table_name, condition=" AND status='reserved' AND connection_id=%s",
+                         hashes=','.join(['%s'] * len(jobs))),
+            args=[table_name, self.connection.connection_id] + list(jobs)))
+        return [key for hash_, key in jobs.items() if hash_ in reserved]
+
     def complete(self, table_name, key):
         """
         Log a completed job.  When a job is completed, its reservation entry is deleted.
@@ -99,6 +166,67 @@ class JobTable(BaseRelation):
         job_key = dict(table_name=table_name, key_hash=key_hash(key))
         (self & job_key).delete_quick()
 
+    def complete_batch(self, table_name, keys):
+        """
+        Log multiple completed jobs in one round trip.  Their reservation entries are deleted.
+        Entries with errors are kept so that a batch can be released after some of its jobs have failed.
+        Only reservations of the current connection are deleted, so that jobs reclaimed and reserved again
+        by another worker remain reserved.
+        :param table_name: `database`.`table_name`
+        :param keys: an iterable of dicts with the jobs' primary keys
+        """
+        hashes = list(set(key_hash(key) for key in keys))
+        if hashes:
+            self.connection.query(
+                "DELETE FROM {table} WHERE table_name=%s AND status='reserved' AND connection_id=%s "
+                "AND key_hash IN ({hashes})".format(table=self.full_table_name, hashes=','.join(['%s'] * len(hashes))),
+                args=[table_name, self.connection.connection_id] + hashes)
+
+    def heartbeat(self, connection_id=None):
+        """
+        Refresh the heartbeat of all jobs reserved by a connection to indicate that its worker is alive.
+        :param connection_id: the connection that reserved the jobs. Defaults to the current connection.
+        :return: number of jobs reserved by the connection
+        """
+        self.require_heartbeat()
+        args = (self.connection.connection_id if connection_id is None else connection_id,)
+        self.connection.query(self.heartbeat_sql, args=args)
+        # the rowcount of the update excludes rows whose heartbeat was already set in the same second
+        return self.connection.query("SELECT COUNT(*) FROM {table} {condition}".format(
+            table=self.full_table_name, condition=HEARTBEAT_CONDITION), args=args).fetchone()[0]
+
+    @property
+    def heartbeat_sql(self):
+        """
+        :return: the statement refreshing the heartbeat of the jobs reserved by the connection given as its argument
+        """
+        return "UPDATE {table} SET heartbeat=CURRENT_TIMESTAMP {condition}".format(
+            table=self.full_table_name, condition=HEARTBEAT_CONDITION)
+
+    def reclaim_stale(self, timeout=None):
+        """
+        Delete the reservations of jobs whose workers appear to have died so that the jobs can be reserved again.
+        A reservation is stale when its connection is no longer listed in information_schema.processlist or
+        when its heartbeat is older than timeout.
+        Without the PROCESS privilege, the server lists only the connections of the current user. Therefore,
+        the reservations of other users are only reclaimed by timeout.
+        :param timeout: seconds since the last heartbeat after which a reservation is stale. None = no timeout.
+        :return: number of reclaimed jobs
+        """
+        self.require_heartbeat()
+        condition = ("SUBSTRING_INDEX(user, '@', 1) = SUBSTRING_INDEX(USER(), '@', 1) AND "
+                     "connection_id NOT IN (SELECT id FROM information_schema.processlist)")
+        args = ()
+        if timeout is not None:
+            condition = '({condition}) OR heartbeat < NOW() - INTERVAL %s SECOND'.format(condition=condition)
+            args = (timeout,)
+        count = self.connection.query(
+            "DELETE FROM {table} WHERE status='reserved' AND ({condition})".format(
+                table=self.full_table_name, condition=condition), args=args).rowcount
+        if count:
+            logger.info('Reclaimed %d stale jobs in %s' % (count, self.full_table_name))
+        return count
+
     def error(self, table_name, key, error_message):
         """
         Log an error message.  The job reservation is replaced with an error entry.
@@ -133,3 +261,43 @@ class JobManager:
         if database not in self._jobs:
             self._jobs[database] = JobTable(self.connection, database)
         return self._jobs[database]
+
+
+class Heartbeat(threading.Thread):
+    """
+    A daemon thread that periodically refreshes the heartbeat of the jobs reserved by a connection.
+    The heartbeat is sent through a dedicated socket opened with the connection's arguments so that it is visible
+    while the worker's transaction is open. The socket is not taken from the connection pool, which may be exhausted
+    by the threads that populate.
+    :param jobs: the JobTable in which the jobs are reserved
+    :param interval: seconds between heartbeats
+    """
+    def __init__(self, jobs, interval):
+        super().__init__(daemon=True)
+        jobs.require_heartbeat()
+        self._jobs = jobs
+        self._interval = interval
+        self._connection_id = jobs.connection.connection_id   # the session of the calling thread
+        self._stopped = threading.Event()
+
+    def run(self):
+        connection = self._jobs.connection
+        socket = pymysql.connect(init_command=connection.init_fun, **connection.conn_info)
+        socket.autocommit(True)
+        sql = self._jobs.heartbeat_sql
+        try:
+            while not self._stopped.wait(self._interval):
+                try:
+                    with socket.cursor() as cursor:
+                        cursor.execute(sql, (self._connection_id,))
+                except pymysql.err.Error as error:
+                    logger.warning('Could not send heartbeat: %s' % error)
+        finally:
+            socket.close()
+
+    def stop(self):
+        """
+        Stop sending heartbeats and wait for the thread to finish.
+        """
+        self._stopped.set()
+        self.join()
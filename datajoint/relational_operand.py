@@ -1,4 +1,5 @@
 import collections
+import itertools
 from itertools import zip_longest
 import logging
 import numpy as np
@@ -10,6 +11,8 @@ from .fetch import Fetch, Fetch1
 
 logger = logging.getLogger(__name__)
 
+_identifier = re.compile(r'\w+')
+
 
 def equal_ignore_case(str1, str2):
     try:
@@ -37,6 +40,42 @@ def restricts_to_empty(arg):
             isinstance(arg, Not) and restricts_to_same(arg.restriction))
 
 
+def restriction_names(arg):
+    """
+    :return: set of names that restriction arg may refer to. Relations contribute their attributes, mappings and
+        record arrays their keys, and SQL strings all their words, erring on the side of false positives.
+    """
+    if isinstance(arg, Not):
+        return restriction_names(arg.restriction)
+    if isinstance(arg, KeyList):
+        return set(arg.attributes)
+    if isinstance(arg, str):
+        return set(_identifier.findall(arg))
+    if isinstance(arg, RelationalOperand):
+        return set(arg.heading.names)
+    if isinstance(arg, collections.abc.Mapping):
+        return set(arg)
+    if isinstance(arg, (np.void, np.ndarray)) and arg.dtype.fields:
+        return set(arg.dtype.fields)
+    if isinstance(arg, (list, tuple, set, np.ndarray)):
+        return set().union(*(restriction_names(r) for r in arg))
+    return set()
+
+
+def restriction_relations(arg):
+    """
+    :return: list of the relations in restriction arg
+    """
+    if isinstance(arg, Not):
+        return restriction_relations(arg.restriction)
+    if isinstance(arg, RelationalOperand):
+        return [arg]
+    if isinstance(arg, (list, tuple, set)):
+        return [relation for r in arg if isinstance(r, (Not, RelationalOperand, list, tuple, set))
+                for relation in restriction_relations(r)]
+    return []
+
+
 class AndList(list):
     """
     A list of restrictions to by applied to a relation.  The restrictions are AND-ed.
@@ -77,19 +116,25 @@ class RelationalOperand:
     The leaves of this tree of objects are base relations.
     When fetching data from the database, this tree of objects is compiled into an SQL expression.
     RelationalOperand operators are restrict, join, proj, and aggregate.
+    The compiled clauses are cached in each object. Each object has a version that changes when it is restricted in
+    place, and a cached clause is valid as long as the versions of the object and of its operands are unchanged.
     """
 
     def __init__(self, arg=None):
         if arg is None:  # initialize
             # initialize
             self._restrictions = AndList()
+            self._restricting_relations = []
             self._distinct = False
             self._heading = None
         else:  # copy
             assert isinstance(arg, RelationalOperand), 'Cannot make RelationalOperand from %s' % arg.__class__.__name__
             self._restrictions = AndList(arg._restrictions)
+            self._restricting_relations = list(arg._restricting_relations)
             self._distinct = arg.distinct
             self._heading = arg._heading
+        self._compiled = {}
+        self._version = 0   # incremented by every restriction in place
 
     @classmethod
     def create(cls):  # pragma: no cover
@@ -131,17 +176,68 @@ class RelationalOperand:
     def primary_key(self):
         return self.heading.primary_key
 
+    @property
+    def _operands(self):
+        """
+        :return: the relations compiled into the SQL of this relation: its arguments and the relations in its
+            restrictions
+        """
+        return [arg for arg in (getattr(self, name, None) for name in ('_arg', '_arg1', '_arg2'))
+                if isinstance(arg, RelationalOperand)] + self._restricting_relations
+
+    @property
+    def _state(self):
+        """
+        :return: the versions of this relation and of its operands, recursively
+        """
+        return (self._version,) + tuple(operand._state for operand in self._operands)
+
+    def _compile(self, key, make):
+        """
+        :param key: identifies the compiled item, e.g. 'where' or ('sql', select_fields)
+        :param make: function computing the item when it is not cached
+        :return: the cached item
+        """
+        state = self._state
+        try:
+            cached_state, item = self._compiled[key]
+        except KeyError:
+            pass
+        else:
+            if cached_state == state:
+                return item
+        item = make()
+        self._compiled[key] = state, item
+        return item
+
     @property
     def where_clause(self):
         """
         convert self.restrictions to the SQL WHERE clause
         """
+        return self._compile('where', self._make_where_clause)
+
+    def _make_where_clause(self):
+        """
+        :return: the WHERE clause compiled from self.restrictions
+        """
 
         def make_condition(arg, _negate=False):
             if isinstance(arg, str):
                 return arg, _negate
             elif isinstance(arg, AndList):
                 return '(' + ' AND '.join([make_condition(element)[0] for element in arg]) + ')', _negate
+            # semijoin or antijoin with a temporary table of keys
+            elif isinstance(arg, KeyList):
+                common_attributes = [q for q in arg.attributes if q in self.heading.names]
+                if not common_attributes:
+                    condition = 'FALSE' if _negate else 'TRUE'
+                else:
+                    condition = '({fields}) {not_}in (SELECT {fields} FROM {table})'.format(
+                        fields='`' + '`,`'.join(common_attributes) + '`',
+                        not_="not " if _negate else "",
+                        table=arg.full_table_name)
+                return condition, False  # _negate is cleared
             # semijoin or antijoin
             elif isinstance(arg, RelationalOperand):
                 common_attributes = [q for q in self.heading.names if q in arg.heading.names]
@@ -310,6 +406,9 @@ class RelationalOperand:
         relational_operand.restrict is the only access point that modifies restrictions. All other operators must
         ultimately call restrict()
 
+        Restrictions by lists of dicts or by record arrays with at least config['restriction.key_table_threshold']
+        elements are uploaded to a temporary table and applied as a semijoin (see KeyList).
+
         :param restriction: a sequence or an array (treated as OR list), another relation, an SQL condition string, or
             an AndList.
         """
@@ -317,9 +416,11 @@ class RelationalOperand:
             assert not self.heading.expressions or isinstance(self, GroupBy), \
                 "Cannot restrict in place a projection with renamed attributes."
             if isinstance(restriction, AndList):
-                self.restrictions.extend(restriction)
+                self.restrictions.extend(KeyList.convert(self, r) for r in restriction)
             else:
-                self.restrictions.append(restriction)
+                self.restrictions.append(KeyList.convert(self, restriction))
+            self._restricting_relations.extend(restriction_relations(restriction))
+            self._version += 1
         return self
 
     @property
@@ -332,13 +433,13 @@ class RelationalOperand:
 
     def attributes_in_restriction(self):
         """
-        :return: list of attributes that are probably used in the restrictions.
+        :return: set of attributes that are probably used in the restrictions.
             The function errs on the side of false positives.
             For example, if the restriction is "val='id'", then the attribute 'id' would be flagged.
             This is used internally for optimizing SQL statements.
         """
-        return set(name for name in self.heading.names
-                   if re.search(r'\b' + name + r'\b', self.where_clause))
+        return self._compile('attributes', lambda: set(self.heading.names).intersection(
+            restriction_names(self.restrictions)))
 
     def __repr__(self):
         return super().__repr__() if config['loglevel'].lower() == 'debug' else self.preview()
@@ -457,10 +558,11 @@ class RelationalOperand:
             count=('<p>%d tuples</p>' % len(rel)) if config['display.show_tuple_count'] else '')
 
     def make_sql(self, select_fields=None):
-        return 'SELECT {fields} FROM {from_}{where}'.format(
-            fields=("DISTINCT " if self.distinct else "") + self.get_select_fields(select_fields),
-            from_=self.from_clause,
-            where=self.where_clause)
+        return self._compile(('sql', select_fields if select_fields is None else tuple(select_fields)),
+                             lambda: 'SELECT {fields} FROM {from_}{where}'.format(
+                                 fields=("DISTINCT " if self.distinct else "") + self.get_select_fields(select_fields),
+                                 from_=self.from_clause,
+                                 where=self.where_clause))
 
     def __len__(self):
         """
@@ -470,21 +572,24 @@ class RelationalOperand:
 
     def __bool__(self):
         """
-        :return:  True if the relation is not empty. Equivalent to len(rel)>0 but may be more efficient.
+        :return:  True if the relation is not empty. Equivalent to len(rel)>0 but the query stops at the first
+            matching tuple rather than counting them all.
         """
-        return len(self) > 0
+        return bool(self.connection.query(
+            'SELECT EXISTS({sql} LIMIT 1)'.format(sql=self.make_sql())).fetchone()[0])
 
     def __contains__(self, item):
         """
         returns True if item is found in the relation.
         :param item: any restriction
-        (item in relation) is equivalent to bool(self & item) but may be executed more efficiently.
+        (item in relation) is equivalent to bool(self & item) and is checked with an EXISTS query.
         """
-        return bool(self & item)  # May be optimized e.g. using an EXISTS query
+        return bool(self & item)
 
-    def cursor(self, offset=0, limit=None, order_by=None, as_dict=False):
+    def cursor(self, offset=0, limit=None, order_by=None, as_dict=False, unbuffered=False):
         """
         See Relation.fetch() for input description.
+        :param unbuffered: if True, rows are read from the server as they are fetched from the cursor.
         :return: query cursor
         """
         if offset and limit is None:
@@ -495,7 +600,7 @@ class RelationalOperand:
         if limit is not None:
             sql += ' LIMIT %d' % limit + (' OFFSET %d' % offset if offset else "")
         logger.debug(sql)
-        return self.connection.query(sql, as_dict=as_dict)
+        return self.connection.query(sql, as_dict=as_dict, unbuffered=unbuffered)
 
 
 class Not:
@@ -507,6 +612,94 @@ class Not:
         self.restriction = True if isinstance(restriction, U) else restriction
 
 
+class KeyList:
+    """
+    A restriction by a large collection of keys, which is uploaded to a temporary table with a primary key on the
+    key attributes and applied as a semijoin instead of a long OR-list of conditions.
+    The table is created in each session that executes a query referring to it (see Connection.query).
+    KeyList is a private DataJoint class not exposed to users.
+    """
+    __counter = itertools.count()
+
+    def __init__(self, connection, database, attributes, rows):
+        """
+        :param connection: the dj.Connection in whose sessions the table is created
+        :param database: database in which the temporary table is created
+        :param attributes: list of Attributes of the keys
+        :param rows: list of tuples of key values
+        """
+        self.attributes = [attr.name for attr in attributes]
+        self.columns = ['`{name}` {type} NOT NULL'.format(name=attr.name, type=attr.type) for attr in attributes]
+        self.rows = rows
+        self.full_table_name = '`{database}`.`~keys_{n:x}`'.format(database=database, n=next(KeyList.__counter))
+        connection.register_key_list(self)
+
+    @classmethod
+    def convert(cls, relation, arg):
+        """
+        :param relation: the relation being restricted
+        :param arg: a restriction
+        :return: a KeyList (or Not(KeyList)) if arg is a list of dicts with the same attributes of relation or a
+            record array with at least config['restriction.key_table_threshold'] elements, otherwise arg unchanged.
+            arg is also unchanged if the user lacks the privilege to create temporary tables or during a transaction,
+            in which servers with enforce_gtid_consistency cannot create temporary tables.
+        """
+        threshold = config['restriction.key_table_threshold']
+        negate = isinstance(arg, Not)
+        keys = arg.restriction if negate else arg
+        if (threshold is None or not isinstance(keys, (list, tuple, np.ndarray)) or len(keys) < threshold or
+                relation.connection.in_transaction):
+            return arg
+        heading = relation.heading
+        if isinstance(keys, np.ndarray) and keys.dtype.fields:
+            attributes = [name for name in heading.names if name in keys.dtype.fields]
+            rows = keys[attributes].tolist() if attributes else None
+        elif all(isinstance(key, collections.abc.Mapping) for key in keys):
+            attributes = [name for name in heading.names if name in keys[0]]
+            names = set(heading.names)
+            if any(names.intersection(key) != set(attributes) for key in keys):
+                return arg   # the keys restrict different attributes
+            rows = [tuple(v.item() if isinstance(v, np.generic) else v for v in (key[a] for a in attributes))
+                    for key in keys]
+        else:
+            return arg
+        if not attributes or any(heading[name].is_blob for name in attributes):
+            return arg
+        base = relation
+        while not hasattr(base, 'database'):  # find the database of a base relation in the expression
+            base = base._arg if hasattr(base, '_arg') else base._arg1
+        if not relation.connection.can_create_key_tables(base.database):
+            return arg
+        keys = cls(relation.connection, base.database, [heading[name] for name in attributes], rows)
+        return Not(keys) if negate else keys
+
+    def upload(self, connection):
+        """
+        Creates the temporary table in the session of the calling thread and inserts the keys, in statements whose
+        estimated size fits in the server's max_allowed_packet.
+        """
+        connection.query('CREATE TEMPORARY TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY (`{key}`))'.format(
+            table=self.full_table_name, columns=', '.join(self.columns), key='`,`'.join(self.attributes)))
+        placeholder = '(' + ','.join(['%s'] * len(self.attributes)) + ')'
+
+        def insert_batch(batch):
+            connection.query('INSERT IGNORE INTO {table} VALUES {values}'.format(
+                table=self.full_table_name, values=','.join([placeholder] * len(batch))),
+                args=list(itertools.chain.from_iterable(batch)))
+
+        budget = connection.max_allowed_packet // 2
+        batch, batch_size = [], 0
+        for row in self.rows:
+            row_size = sum(len(v) + 4 if isinstance(v, (str, bytes)) else 24 for v in row)
+            if batch and batch_size + row_size > budget:
+                insert_batch(batch)
+                batch, batch_size = [], 0
+            batch.append(row)
+            batch_size += row_size
+        if batch:
+            insert_batch(batch)
+
+
 class Join(RelationalOperand):
     """
     Relational join.
@@ -554,6 +747,7 @@ class Join(RelationalOperand):
 
     @property
     def from_clause(self):
+        # not cached: subqueries receive new aliases on each call so that the join may appear more than once in a query
         return '{from1} NATURAL{left} JOIN {from2}'.format(
             from1=self._arg1.from_clause,
             left=" LEFT" if self._left else "",
@@ -660,12 +854,13 @@ class GroupBy(RelationalOperand):
         return obj
 
     def make_sql(self, select_fields=None):
-        return 'SELECT {fields} FROM {from_}{where} GROUP  BY `{group_by}`{having}'.format(
-            fields=self.get_select_fields(select_fields),
-            from_=self._arg.from_clause,
-            where=self._arg.where_clause,
-            group_by='`,`'.join(self.primary_key),
-            having=re.sub(r'^ WHERE', ' HAVING', self.where_clause))
+        return self._compile(('sql', select_fields if select_fields is None else tuple(select_fields)),
+                             lambda: 'SELECT {fields} FROM {from_}{where} GROUP  BY `{group_by}`{having}'.format(
+                                 fields=self.get_select_fields(select_fields),
+                                 from_=self._arg.from_clause,
+                                 where=self._arg.where_clause,
+                                 group_by='`,`'.join(self.primary_key),
+                                 having=re.sub(r'^ WHERE', ' HAVING', self.where_clause)))
 
     def __len__(self):
         return len(Subquery.create(self))
@@ -706,6 +901,7 @@ class Subquery(RelationalOperand):
 
     @property
     def from_clause(self):
+        # the alias is renewed on each call so that a subquery may appear more than once in a query
         return '(' + self._arg.make_sql() + ') as `_s%x`' % self.counter
 
     def get_select_fields(self, select_fields=None):
@@ -4,8 +4,8 @@ import logging
 import inspect
 import re
 from . import conn, DataJointError, config
-from .erd import ERD
 from .heading import Heading
+from .catalog import Catalog
 from .utils import user_choice, to_camel_case
 from .user_relations import Part, Computed, Imported, Manual, Lookup
 from .base_relation import lookup_class_name, Log
@@ -70,6 +70,10 @@ class Schema:
                                          " permissions.".format(database=database))
                 else:
                     self.log('created')
+        else:
+            # load the metadata of all tables at once so that decorated classes are declared and their headings
+            # initialized from the heading cache
+            Catalog(connection, database)
         self.log('connect')
         connection.register(self)
 
@@ -98,11 +102,11 @@ class Schema:
     def spawn_missing_classes(self):
         """
         Creates the appropriate python user relation classes from tables in the database and places them
-        in the context.
+        in the context. The metadata of all tables are loaded at once into a Catalog.
         """
         tables = [
-            row[0] for row in self.connection.query('SHOW TABLES in `%s`' % self.database)
-            if lookup_class_name('`{db}`.`{tab}`'.format(db=self.database, tab=row[0]), self.context, 0) is None]
+            table_name for table_name in Catalog(self.connection, self.database).tables
+            if lookup_class_name('`{db}`.`{tab}`'.format(db=self.database, tab=table_name), self.context, 0) is None]
         master_classes = (Lookup, Manual, Imported, Computed)
         part_tables = []
         for table_name in tables:
@@ -142,6 +146,8 @@ class Schema:
             logger.info("Dropping `{database}`.".format(database=self.database))
             try:
                 self.connection.query("DROP DATABASE `{database}`".format(database=self.database))
+                self.connection.heading_cache.invalidate(self.database)
+                self.connection.invalidate_dependencies()
                 logger.info("Database `{database}` was dropped successfully.".format(database=self.database))
             except pymysql.OperationalError:
                 raise DataJointError("An attempt to drop database named `{database}` "
@@ -218,6 +224,7 @@ class Schema:
         return self.connection.jobs[self.database]
 
     def erd(self):
+        from .erd import ERD
         # get the caller's locals()
         import inspect
         frame = inspect.currentframe()
@@ -16,6 +16,17 @@ GLOBALCONFIG = '.datajoint_config.json'
 
 validators = collections.defaultdict(lambda: lambda value: True)
 validators['database.port'] = lambda a: isinstance(a, int)
+validators['database.max_allowed_packet'] = lambda a: a is None or isinstance(a, int) and a > 0
+validators['database.local_infile'] = lambda a: isinstance(a, bool)
+validators['fetch.unpack_threads'] = lambda a: isinstance(a, int) and a > 0
+validators['connection.pool_size'] = lambda a: a is None or isinstance(a, int) and a > 0
+validators['connection.pool_min_size'] = lambda a: isinstance(a, int) and a >= 0
+validators['connection.heading_cache_ttl'] = lambda a: a is None or isinstance(a, (int, float)) and a >= 0
+validators['restriction.key_table_threshold'] = lambda a: a is None or isinstance(a, int) and a > 0
+validators['blob.format'] = lambda a: a in ('mYm', 'dj1')
+validators['blob.compression'] = lambda a: a is None or a is False or isinstance(a, str)
+validators['blob.compression_threshold'] = lambda a: isinstance(a, int) and a >= 0
+validators['blob.compression_trial_ratio'] = lambda a: a is None or isinstance(a, (int, float)) and a > 0
 
 Role = Enum('Role', 'manual lookup imported computed job')
 role_to_prefix = {
@@ -29,7 +40,10 @@ prefix_to_role = dict(zip(role_to_prefix.values(), role_to_prefix.keys()))
 
 
 server_error_codes = {
+    'database access denied': 1044,
     'unknown column': 1054,
+    'duplicate column': 1060,
+    'duplicate entry': 1062,
     'command denied': 1142,
     'tables does not exist': 1146,
     'syntax error': 1149
@@ -42,12 +56,24 @@ default = OrderedDict({
     'database.user': None,
     'database.port': 3306,
     'connection.init_function': None,
+    'connection.pool_size': None,
+    'connection.pool_min_size': 1,
+    'connection.heading_cache': None,
+    'connection.heading_cache_ttl': 60,
     'database.reconnect': False,
+    'database.max_allowed_packet': None,
+    'database.local_infile': False,
+    'restriction.key_table_threshold': 5000,
+    'blob.format': 'mYm',
+    'blob.compression': 'zlib',
+    'blob.compression_threshold': 1024,
+    'blob.compression_trial_ratio': 0.9,
     'loglevel': 'INFO',
     'safemode': True,
     'display.limit': 7,
     'display.width': 14,
-    'display.show_tuple_count': True
+    'display.show_tuple_count': True,
+    'fetch.unpack_threads': 1
 })
 
 logger = logging.getLogger(__name__)
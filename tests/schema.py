@@ -199,6 +199,25 @@ class Image(dj.Manual):
     """
 
 
+@schema
+class NullableColumns(dj.Manual):
+    definition = """  # table for testing NULL values in non-numeric columns
+    id : int
+    ---
+    name = null : varchar(40)
+    recorded = null : datetime
+    """
+
+
+@schema
+class BinaryData(dj.Manual):
+    definition = """  # table for testing non-blob binary values
+    id : int
+    ---
+    data : varbinary(16)
+    """
+
+
 @schema
 class UberTrash(dj.Lookup):
     definition = """
@@ -226,6 +245,37 @@ class SimpleSource(dj.Lookup):
     contents = ((x,) for x in range(10))
 
 
+@schema
+class ErrorBatchTable(dj.Computed):
+    definition = """
+    -> SimpleSource
+    """
+    failing_id = 5
+
+    def _make_tuples(self, key):
+        if key['id'] == self.failing_id:
+            raise ValueError('cannot populate id %d' % key['id'])
+        self.insert1(key)
+
+    def _make_batch(self, keys):
+        self.insert(keys)   # inserts all keys before failing so that the batch must be rolled back
+        if any(key['id'] == self.failing_id for key in keys):
+            raise ValueError('cannot populate id %d' % self.failing_id)
+
+
+@schema
+class SharedJobTable(dj.Computed):
+    definition = """
+    -> SimpleSource
+    """
+
+    def _job_key(self, key):
+        return dict(id=key['id'] // 5)   # several keys share each job
+
+    def _make_tuples(self, key):
+        self.insert1(key)
+
+
 @schema
 class SigIntTable(dj.Computed):
     definition = """
@@ -1,8 +1,11 @@
+import datetime
+import signal
 from nose.tools import assert_raises, assert_equal, \
     assert_false, assert_true, assert_list_equal, \
     assert_tuple_equal, assert_dict_equal, raises
 
 from . import schema
+from datajoint import autopopulate
 
 
 class TestPopulate:
@@ -49,3 +52,84 @@ class TestPopulate:
         self.ephys.populate()
         assert_true(self.ephys)
         assert_true(self.channel)
+
+    def test_populate_processes(self):
+        # test populate with multiple worker processes
+        assert_false(self.experiment, 'table already filled?')
+        self.experiment.populate(processes=2, reserve_jobs=True)
+        assert_equal(len(self.experiment),
+                     len(self.subject)*self.experiment.fake_experiments_per_subject)
+        assert_false(schema.schema.jobs & dict(table_name=self.experiment.table_name),
+                     'jobs were not completed')
+
+    def test_populate_reserve_batch(self):
+        # test populate reserving jobs in batches
+        assert_false(self.experiment, 'table already filled?')
+        self.experiment.populate(reserve_jobs=True, reserve_batch_size=3)
+        assert_equal(len(self.experiment),
+                     len(self.subject)*self.experiment.fake_experiments_per_subject)
+        assert_false(schema.schema.jobs & dict(table_name=self.experiment.table_name),
+                     'jobs were not completed')
+
+    def test_populate_shared_jobs(self):
+        # test populate reserving jobs in batches when several keys map to the same job
+        table = schema.SharedJobTable()
+        table.delete_quick()
+        table.populate(reserve_jobs=True, reserve_batch_size=4)
+        assert_equal(len(table), len(schema.SimpleSource()))
+        assert_false(schema.schema.jobs & dict(table_name=table.table_name), 'jobs were not completed')
+        table.delete_quick()
+
+    def test_populate_batch(self):
+        # test populate with several keys per transaction
+        assert_false(self.experiment, 'table already filled?')
+        self.experiment.populate(batch_size=4)
+        assert_equal(len(self.experiment),
+                     len(self.subject)*self.experiment.fake_experiments_per_subject)
+
+    def test_populate_batch_error(self):
+        # test that a failed batch is rolled back and its keys are populated one at a time
+        table = schema.ErrorBatchTable()
+        table.delete_quick()
+        for reserve_jobs in (False, True):
+            errors = table.populate(batch_size=4, suppress_errors=True, reserve_jobs=reserve_jobs)
+            assert_equal([key for key, error in errors], [dict(id=table.failing_id)])
+            assert_equal(len(table), len(schema.SimpleSource()) - 1)
+            assert_false(table & dict(id=table.failing_id), 'the failed batch was not rolled back')
+            table.delete_quick()
+        jobs = schema.schema.jobs & dict(table_name=table.table_name)
+        assert_equal(len(jobs & 'status="error"'), 1)
+        assert_equal(len(jobs), 1)
+        jobs.delete()
+
+    def test_populate_error_restores_handler(self):
+        # test that the SIGTERM handler is restored when populate raises
+        table = schema.ErrorBatchTable()
+        table.delete_quick()
+        handler = signal.getsignal(signal.SIGTERM)
+        assert_raises(ValueError, table.populate, reserve_jobs=True)
+        assert_true(signal.getsignal(signal.SIGTERM) is handler, 'the SIGTERM handler was not restored')
+        table.delete_quick()
+        (schema.schema.jobs & dict(table_name=table.table_name)).delete()
+
+    def test_populate_pages(self):
+        # test populate fetching keys in small pages in every order
+        page_size = autopopulate.KEY_PAGE_SIZE
+        autopopulate.KEY_PAGE_SIZE = 2
+        try:
+            total = len(self.subject)*self.experiment.fake_experiments_per_subject
+            self.experiment.populate(order='reverse', limit=3)
+            assert_equal(len(self.experiment), 3*self.experiment.fake_experiments_per_subject)
+            self.experiment.populate(order='random')
+            assert_equal(len(self.experiment), total)
+        finally:
+            autopopulate.KEY_PAGE_SIZE = page_size
+
+
+def test_keyset_condition():
+    # key values are rendered as escaped SQL literals rather than python reprs
+    condition = autopopulate.keyset_condition(
+        ['a', 'b', 'c'], dict(a=b'\x00x', b=datetime.timedelta(hours=1), c="it's"), '>=')
+    assert_true("`b`>'01:00:00'" in condition and "`c`='it\\'s'" in condition)
+    assert_true("b'" not in condition and 'timedelta' not in condition)
+    assert_equal(condition.count(' OR '), 3)
@@ -1,5 +1,8 @@
 import numpy as np
+import datajoint as dj
 from datajoint.blob import pack, unpack
+from datajoint import DataJointError
+from datajoint.instrumentation import compression_stats
 from numpy.testing import assert_array_equal, raises
 from nose.tools import assert_equal, assert_true
 
@@ -39,3 +42,99 @@ def test_complex():
 
     x = np.int16(np.random.randn(1, 2, 3)) + 1j*np.int16(np.random.randn(1, 2, 3))
     assert_array_equal(x, unpack(pack(x)), "Arrays do not match!")
+
+
+def test_memory_layouts():
+    x = np.random.randn(6, 7)
+    for y in (x, np.asfortranarray(x), x[:, ::2], x.T, x[::2, 1:] + 1j * x[1::2, 1:]):
+        assert_array_equal(y, unpack(pack(y)), "Arrays do not match!")
+        assert_array_equal(y, unpack(pack(y, compress=False)), "Arrays do not match!")
+
+
+def test_nested_dict():
+    x = {'f%d' % i: {'a': np.arange(i), 'b': 'text'} for i in range(1000)}
+    y = unpack(pack(x), as_dict=True)
+    assert_equal(list(x), list(y))
+    for k in x:
+        assert_array_equal(x[k]['a'], y[k]['a'].flatten())
+        assert_equal(y[k]['b'], 'text')
+
+
+def test_codecs():
+    x = np.cumsum(np.random.randn(10, 64, 64).astype('float32'), axis=2)
+    with dj.config(blob__compression_trial_ratio=None):
+        assert_equal(pack(x)[:6], b'ZL123\0')
+        for codec, prefix in (('zlib:1', b'ZL123\0'), ('bz2', b'BZ123\0'), ('lzma', b'XZ123\0'),
+                              ('shuffle+zlib', b'ZL123\0'), ('shuffle+lzma:1', b'XZ123\0'), ('none', b'mYm\0')):
+            blob = pack(x, compress=codec)
+            assert_equal(blob[:len(prefix)], prefix)
+            assert_array_equal(x, unpack(blob), "Arrays do not match!")
+        assert_true(len(pack(x, compress='shuffle+zlib')) < len(pack(x, compress='zlib')))
+
+
+def test_shuffle_wide_dtype():
+    x = np.array(['%0100d' % i for i in range(200)])   # itemsize 400 exceeds the shuffle typesize field
+    with dj.config(blob__compression_trial_ratio=None):
+        blob = pack(x, compress='shuffle+zlib', blob_format='dj1')
+    assert_equal(blob[:6], b'ZL123\0')
+    assert_array_equal(x, unpack(blob), "Arrays do not match!")
+
+
+@raises(DataJointError)
+def test_unknown_codec():
+    pack(np.arange(10), compress='gzip')
+
+
+def test_compression_heuristics():
+    compression_stats.clear()
+    assert_equal(pack(np.arange(10, dtype=np.int64))[:4], b'mYm\0')  # small
+    assert_equal(pack(np.random.randn(100, 100))[:4], b'mYm\0')  # incompressible
+    assert_equal(pack(np.zeros((100, 100)))[:6], b'ZL123\0')
+    assert_equal(pack(np.zeros(1000, dtype=np.int16))[:6], b'ZL123\0')
+    decisions = {(decision, dtype): totals['blobs'] for (decision, dtype), totals in compression_stats.stats.items()}
+    assert_equal(decisions, {('small', 'int64'): 1, ('incompressible', 'float64'): 1,
+                             ('compressed', 'float64'): 1, ('compressed', 'int16'): 1})
+
+
+def test_native_format():
+    for x in (np.random.randn(8, 10), np.asfortranarray(np.random.randn(8, 10)), np.random.randn(6, 8)[::2, 1:],
+              np.float16([1, 2, 3]), np.array([True, False]), np.array(['α', 'βγ']),
+              np.array(['2017-01-01', '2017-12-31'], dtype='datetime64[D]'), np.random.randn(3, 4) + 1j,
+              np.zeros(3, dtype=[('x', '<f4'), ('y', '<i2', (2,))])):
+        y = unpack(pack(x, blob_format='dj1'))
+        assert_equal(x.dtype, y.dtype)
+        assert_equal(x.shape, y.shape)
+        assert_equal(x.tobytes(), y.tobytes())
+    for x in (None, True, 7, 2 ** 80, 2.5, 1 - 2j, 'text', b'\0bytes', [1, 'a', None], (1, 2.0), {'a': [1, {'b': 2}]}):
+        assert_equal(x, unpack(pack(x, blob_format='dj1')))
+    x = {'array': np.arange(5), 'objects': np.array([1, 'a'], dtype=object), 'scalar': np.float32(0.5)}
+    y = unpack(pack(x, blob_format='dj1'))
+    assert_array_equal(x['array'], y['array'])
+    assert_equal(list(x['objects']), list(y['objects']))
+    assert_equal(type(y['scalar']), np.float32)
+
+
+def test_native_format_config():
+    with dj.config(blob__format='dj1'):
+        blob = pack(np.arange(3), compress=False)
+    assert_equal(blob[:4], b'dj1\0')
+    assert_array_equal(np.arange(3), unpack(blob))
+    assert_equal(pack(np.arange(3), compress=False)[:4], b'mYm\0')
+
+
+def test_zero_copy():
+    x = np.random.randn(50, 40)
+    for blob in (pack(x, compress=False), pack(x, compress='zlib'), pack(x, blob_format='dj1', compress=False),
+                 pack(np.asfortranarray(x), blob_format='dj1', compress='shuffle+zlib')):
+        view = unpack(blob)
+        assert_array_equal(x, view)
+        assert_true(not view.flags.writeable and not view.flags.owndata)
+        y = unpack(blob, copy=True)
+        assert_array_equal(x, y)
+        assert_true(y.flags.writeable)
+    y = unpack(pack(x[:, :1], compress=False), squeeze=True)
+    assert_equal(y.shape, (50,))
+    assert_true(y.flags.writeable)
+    y = unpack(pack(x[:, :1], compress=False), squeeze=True, copy=False)
+    assert_equal(y.shape, (50,))
+    assert_true(not y.flags.writeable)
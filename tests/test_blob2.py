@@ -65,3 +65,13 @@ class TestFetch:
         assert_true(blobs[5].dtype == 'uint8')
         assert_tuple_equal(blobs[6].shape, (2, 3, 4))
         assert_true(blobs[6].dtype == 'complex128')
+
+    def test_unpack_threads(self):
+        serial = Blob().fetch('blob', order_by='id', unpack_threads=1)
+        threaded = Blob().fetch('blob', order_by='id', unpack_threads=4)
+        for a, b in zip(serial, threaded):
+            assert_equal(repr(a), repr(b))
+        with dj.config(fetch__unpack_threads=4):
+            iterated = [row[-1] for row in sorted(Blob().fetch, key=lambda row: row[0])]
+        for a, b in zip(serial, iterated):
+            assert_equal(repr(a), repr(b))
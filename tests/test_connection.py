@@ -2,7 +2,8 @@
 Collection of test cases to test connection module.
 """
 
-from nose.tools import assert_true, assert_equal
+import threading
+from nose.tools import assert_true, assert_equal, raises
 import datajoint as dj
 import numpy as np
 from datajoint import DataJointError
@@ -38,6 +39,73 @@ def test_repr():
     assert_true('disconnected' not in repr(c1) and 'connected' in repr(c1))
 
 
+def test_pool():
+    """
+    Threads using a pooled connection get separate sessions
+    """
+    c = dj.Connection(CONN_INFO['host'], CONN_INFO['user'], CONN_INFO['password'], pool_size=3, pool_min_size=2)
+    assert_equal(len(c.pool), 2)
+    ids = []
+
+    def work():
+        with c.checkout():
+            ids.append(c.connection_id)
+            c.query('SELECT SLEEP(0.2)')
+
+    threads = [threading.Thread(target=work) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert_equal(len(set(ids)), 3)
+    assert_equal(len(c.pool), 3)
+    assert_true(c.is_connected)
+    c.close()
+
+
+@raises(DataJointError)
+def test_pool_exhausted():
+    c = dj.Connection(CONN_INFO['host'], CONN_INFO['user'], CONN_INFO['password'], pool_size=1)
+    c.pool.timeout = 0.1
+    c.query('SELECT 1')
+    try:
+        thread_error = []
+
+        def work():
+            try:
+                c.query('SELECT 1')
+            except DataJointError as e:
+                thread_error.append(e)
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+        raise thread_error[0]
+    finally:
+        c.close()
+
+
+def test_query_stats():
+    """
+    Queries are reported to hooks and aggregated by fingerprint
+    """
+    c = dj.conn(**CONN_INFO)
+    events = []
+    c.add_query_hook(events.append)
+    with c.collect_stats() as stats:
+        for i in range(3):
+            assert_equal(c.query('SELECT %s, "abc"', args=(i,)).fetchall(), ((i, 'abc'),))
+    c.remove_query_hook(events.append)
+    c.query('SELECT 1')
+    assert_equal(len(events), 3)
+    assert_equal(events[0].rows, 1)
+    assert_equal(events[0].bytes_received, 11)
+    (sql, totals), = stats.top(5)
+    assert_equal(sql, 'SELECT ?, ?')
+    assert_equal(totals['calls'], 3)
+    assert_equal(totals['rows'], 3)
+    assert_true('SELECT ?, ?' in stats.report())
+
+
 class TestTransactions:
     """
     test transaction management
@@ -98,6 +98,37 @@ class TestFetch:
         for row, (tname, tlang) in list(zip(cur, languages)):
             assert_true(row['name'] == tname and row['language'] == tlang, 'Values are not the same')
 
+    def test_iter_interleaved(self):
+        """Test that iteration survives other queries issued between rows"""
+        expected = list(self.lang.fetch(as_dict=True))
+        rows = []
+        for row in self.lang.fetch:
+            assert_equal(len(self.lang & dict(zip(self.lang.heading.names, row))), 1)
+            rows.append(row)
+        assert_equal(len(rows), len(expected), 'Iteration lost rows')
+
+    def test_iter_in_transaction(self):
+        """Test that iteration survives checks of the connection during a transaction"""
+        expected = len(self.lang)
+        connection = self.lang.connection
+        rows = []
+        with connection.transaction:
+            for row in self.lang.fetch:
+                assert_true(connection.in_transaction)
+                rows.append(row)
+        assert_equal(len(rows), expected, 'Iteration lost rows')
+
+    def test_columns(self):
+        """Test fetching columns as numpy arrays"""
+        records = self.subject.fetch(order_by='subject_id')
+        columns = self.subject.fetch(order_by='subject_id', format='columns')
+        assert_equal(list(columns), list(records.dtype.names))
+        for name in records.dtype.names:
+            np.testing.assert_array_equal(columns[name], records[name])
+        assert_equal(columns['subject_id'].dtype, records['subject_id'].dtype)
+        keys = self.subject.fetch(dj.key, order_by='subject_id', format='columns')
+        assert_equal(keys, self.subject.fetch(dj.key, order_by='subject_id'))
+
     def test_keys(self):
         """test key iterator"""
         languages = schema.Language.contents
@@ -177,3 +208,18 @@ class TestFetch:
         assert_true(len(rel & keys[0]) == 1)
         keys = rel.fetch(dj.key)
         assert_true(len(rel & keys[1]) == 1)
+
+    def test_fetch_copy(self):
+        """Tests fetching blobs as read-only views or, with copy=True, as writable copies"""
+        img = schema.Image()
+        img.insert1((100, np.random.randn(20, 10)))
+        rel = img & 'id=100'
+        x = rel.fetch1('img')
+        assert_true(not x.flags.writeable)
+        assert_true(np.array_equal(x, rel.fetch1('img', copy=True)))
+        assert_true(rel.fetch1('img', copy=True).flags.writeable)
+        assert_true(not rel.fetch()[0]['img'].flags.writeable)
+        assert_true(rel.fetch(copy=True)[0]['img'].flags.writeable)
+        assert_true(rel.fetch1('img', squeeze=True).flags.writeable)
+        assert_true(not rel.fetch1('img', squeeze=True, copy=False).flags.writeable)
+        rel.delete_quick()
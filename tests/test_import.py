@@ -0,0 +1,67 @@
+"""
+Guards the import of datajoint: optional and heavy dependencies are imported on first use.
+"""
+
+import subprocess
+import sys
+from nose.tools import assert_equal, assert_less
+from . import PREFIX, CONN_INFO
+
+script = """
+import sys
+import datajoint
+print(' '.join(m for m in ('networkx', 'pyparsing', 'matplotlib', 'datajoint.erd', 'datajoint.dependencies')
+               if m in sys.modules))
+"""
+
+
+def run_import(statements=''):
+    out = subprocess.check_output([sys.executable, '-c', script + statements], universal_newlines=True)
+    return out.splitlines()[-1].split()
+
+
+timing_script = """
+import time
+start = time.perf_counter()
+import numpy, pymysql
+dependencies = time.perf_counter() - start
+start = time.perf_counter()
+import datajoint
+print(dependencies, time.perf_counter() - start)
+"""
+
+
+def time_import():
+    """
+    :return: (seconds to import numpy and pymysql, seconds to import datajoint once they are imported)
+    """
+    out = subprocess.check_output([sys.executable, '-c', timing_script], universal_newlines=True)
+    return tuple(float(t) for t in out.splitlines()[-1].split())
+
+
+def test_import_time():
+    # the import of datajoint itself is bounded relative to the import of its required dependencies, which
+    # eager imports of networkx, pyparsing, or matplotlib would exceed
+    dependencies, own = (min(times) for times in zip(*(time_import() for _ in range(3))))
+    assert_less(own, 2 * dependencies + 0.2)
+
+
+def test_lazy_imports():
+    assert_equal(run_import(), [])
+
+
+def test_lazy_erd():
+    check = "\nprint('datajoint.erd' in sys.modules)"
+    assert_equal(run_import('datajoint.ERD' + check), ['False'])
+    assert_equal(run_import('isinstance(None, datajoint.ERD)' + check), ['True'])
+
+
+def test_declare_without_dependencies():
+    # declaring and dropping tables does not build the dependency graph
+    statements = """
+connection = datajoint.conn(**{conn_info!r})
+schema = datajoint.schema({database!r}, {{}}, connection=connection)
+schema.jobs
+schema.drop(force=True)
+print('networkx' in sys.modules)""".format(conn_info=CONN_INFO, database=PREFIX + '_test_import')
+    assert_equal(run_import(statements), ['False'])
@@ -1,8 +1,10 @@
 from nose.tools import assert_true, assert_false, assert_equals
-from . import schema
-from datajoint.jobs import ERROR_MESSAGE_LENGTH, TRUNCATION_APPENDIX
+import datajoint as dj
+from . import schema, CONN_INFO
+from datajoint.jobs import ERROR_MESSAGE_LENGTH, TRUNCATION_APPENDIX, JobTable, Heartbeat
 import random
 import string
+import time
 
 
 subjects = schema.Subject()
@@ -45,6 +47,74 @@ def test_reserve_job():
                  'failed to clear error jobs')
 
 
+def test_reserve_batch():
+    # clean jobs table
+    jobs = schema.schema.jobs
+    jobs.delete()
+    table_name = 'fake_table'
+    keys = list(subjects.fetch.keys())
+    # reserve half of the jobs individually
+    for key in keys[::2]:
+        assert_true(jobs.reserve(table_name, key), 'failed to reserve a job')
+    reserved = jobs.reserve_batch(table_name, keys)
+    assert_equals(reserved, keys[1::2], 'failed to reserve the remaining jobs in one batch')
+    assert_equals(jobs.reserve_batch(table_name, keys), [], 'failed to respect reservations')
+    jobs.complete_batch(table_name, keys)
+    assert_false(jobs, 'failed to free jobs')
+
+
+def test_reclaim_stale():
+    # clean jobs table
+    jobs = schema.schema.jobs
+    jobs.delete()
+    table_name = 'fake_table'
+    key = list(subjects.fetch.keys())[0]
+    assert_true(jobs.reserve(table_name, key))
+    assert_equals(jobs.heartbeat(), 1, 'failed to refresh the heartbeat')
+    assert_equals(jobs.reclaim_stale(), 0, 'reclaimed a job of a live connection')
+    # fake a reservation by a connection that no longer exists
+    jobs.connection.query('UPDATE {table} SET connection_id=0'.format(table=jobs.full_table_name))
+    assert_equals(jobs.reclaim_stale(), 1, 'failed to reclaim a job of a dead connection')
+    assert_false(jobs, 'failed to free stale jobs')
+    # stale heartbeats
+    assert_true(jobs.reserve(table_name, key))
+    jobs.connection.query('UPDATE {table} SET heartbeat=NOW() - INTERVAL 1 HOUR'.format(table=jobs.full_table_name))
+    assert_equals(jobs.reclaim_stale(timeout=3600 * 2), 0, 'reclaimed a job before its timeout')
+    assert_equals(jobs.reclaim_stale(timeout=60), 1, 'failed to reclaim a job with a stale heartbeat')
+    jobs.delete()
+
+
+def test_heartbeat_pool():
+    # heartbeats do not wait for a socket of an exhausted connection pool
+    connection = dj.Connection(CONN_INFO['host'], CONN_INFO['user'], CONN_INFO['password'], pool_size=1)
+    try:
+        jobs = JobTable(connection, schema.schema.database)
+        jobs.delete()
+        assert_true(jobs.reserve('fake_table', list(subjects.fetch.keys())[0]))
+        connection.query('UPDATE {table} SET heartbeat=NOW() - INTERVAL 1 HOUR'.format(table=jobs.full_table_name))
+        heartbeat = Heartbeat(jobs, 0.1)
+        heartbeat.start()
+        time.sleep(0.5)
+        heartbeat.stop()
+        assert_equals(jobs.reclaim_stale(timeout=60), 0, 'the heartbeat was not sent')
+        jobs.delete()
+    finally:
+        connection.close()
+
+
+def test_heartbeat_upgrade():
+    # a job table declared without heartbeats is altered only when heartbeats are used
+    jobs = schema.schema.jobs
+    connection = jobs.connection
+    connection.query('ALTER TABLE {table} DROP COLUMN heartbeat'.format(table=jobs.full_table_name))
+    connection.heading_cache.invalidate(jobs.database, jobs.table_name)
+    legacy = JobTable(connection, jobs.database)
+    assert_false('heartbeat' in legacy.heading.names, 'the job table was altered on instantiation')
+    assert_equals(legacy.heartbeat(), 0)
+    assert_true('heartbeat' in legacy.heading.names, 'the heartbeat attribute was not added')
+    jobs._heading = None
+
+
 def test_restrictions():
     # clear out jobs table
     jobs = schema.schema.jobs
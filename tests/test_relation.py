@@ -1,4 +1,5 @@
 from inspect import getmembers
+from contextlib import contextmanager
 import re
 
 import numpy as np
@@ -9,7 +10,20 @@ from datajoint import utils
 from datajoint.base_relation import BaseRelation
 from unittest.mock import patch
 
-from . import schema
+from . import schema, CONN_INFO
+
+
+@contextmanager
+def local_infile(relation):
+    """
+    Yields the table of relation on a new connection opened with LOAD DATA LOCAL INFILE enabled
+    """
+    with dj.config(database__local_infile=True):
+        connection = dj.Connection(CONN_INFO['host'], CONN_INFO['user'], CONN_INFO['password'])
+    try:
+        yield dj.FreeRelation(connection, relation.full_table_name)
+    finally:
+        connection.close()
 
 
 def relation_selector(attr):
@@ -187,6 +201,134 @@ class TestRelation:
         Y = self.img.fetch()[0]['img']
         assert_true(np.all(X == Y), 'Inserted and retrieved image are not identical')
 
+    def test_blob_compression_policy(self):
+        """Tests the compression codec of a blob attribute"""
+        self.img.delete_quick()
+        X = np.cumsum(np.random.randn(50, 50).astype('float32'), axis=1)
+        self.img.blob_compression = dict(img='shuffle+lzma')
+        try:
+            self.img.insert1((2, X))
+        finally:
+            self.img.blob_compression = None
+        raw = self.img.connection.query('SELECT img FROM ' + self.img.full_table_name).fetchone()[0]
+        assert_equal(raw[:6], b'XZ123\0')
+        assert_true(np.all(X == (self.img & 'id=2').fetch1('img')))
+        self.img.delete_quick()
+
+    def test_chunked_insert(self):
+        """Tests inserting blobs from a generator in several statements"""
+        self.img.delete_quick()
+        with dj.config(database__max_allowed_packet=20000):
+            self.img.insert((i, np.random.randn(500)) for i in range(10))
+        assert_equal(len(self.img), 10)
+        # a failing statement rolls back the preceding statements of the same insert
+        try:
+            with dj.config(database__max_allowed_packet=20000):
+                self.img.insert((i, np.random.randn(500)) for i in list(range(10, 30, 2)) + [10])
+        except IntegrityError:
+            pass
+        assert_equal(len(self.img), 10)
+        self.img.delete_quick()
+
+    def test_columnar_insert(self):
+        """Tests inserting structured arrays and dicts of columns"""
+        self.test_no_extra.delete_quick()
+        rows = np.array([(3*k, k) for k in range(100)], dtype=[('value', np.int64), ('key', np.int32)])
+        self.test_no_extra.insert(rows)
+        self.test_no_extra.insert(dict(key=np.arange(100, 200), value=np.arange(100, 200)*3))
+        keys, values = self.test_no_extra.fetch('key', 'value', order_by='key')
+        assert_list_equal(list(keys), list(range(200)))
+        assert_list_equal(list(values), list(range(0, 600, 3)))
+        self.test_no_extra.delete_quick()
+
+    def test_columnar_insert_null(self):
+        """Tests inserting None and NaT into non-numeric columns of a dict of columns"""
+        rel = schema.NullableColumns()
+        rel.delete_quick()
+        rel.insert(dict(id=np.arange(3), name=['a', None, 'c'],
+                        recorded=np.array(['2017-01-01T12:00', 'NaT', 'NaT'], dtype='datetime64[s]')))
+        names, recorded = rel.fetch('name', 'recorded', order_by='id')
+        assert_list_equal(list(names), ['a', None, 'c'])
+        assert_list_equal([r is None for r in recorded], [False, True, True])
+        rel.delete_quick()
+
+    @raises(dj.DataJointError)
+    def test_columnar_insert_single_row(self):
+        self.test_no_extra.insert(dict(key=1, value=2))
+
+    @raises(KeyError)
+    def test_columnar_insert_extra_field(self):
+        self.test_no_extra.insert(dict(key=np.arange(3), value=np.arange(3), extra=np.arange(3)))
+
+    def test_bulk_load(self):
+        """Tests loading rows with blobs through LOAD DATA LOCAL INFILE"""
+        self.img.delete_quick()
+        images = [np.random.randn(20, 10) for _ in range(5)]
+        with local_infile(self.img) as img:
+            img.bulk_load((i, image) for i, image in enumerate(images))
+            assert_equal(len(self.img), 5)
+            for i, image in enumerate(images):
+                assert_true(np.array_equal((self.img & dict(id=i)).fetch1('img'), image))
+            img.bulk_load([(0, images[1]), (7, images[1])], skip_duplicates=True)
+            assert_equal(len(self.img), 6)
+            assert_true(np.array_equal((self.img & dict(id=0)).fetch1('img'), images[0]))
+            img.bulk_load([(0, images[1])], replace=True)
+            assert_true(np.array_equal((self.img & dict(id=0)).fetch1('img'), images[1]))
+        self.img.delete_quick()
+
+    @raises(dj.DataJointError)
+    def test_bulk_load_duplicate(self):
+        self.test_no_extra.delete_quick()
+        with local_infile(self.test_no_extra) as rel:
+            rel.bulk_load(dict(key=np.arange(3), value=np.arange(3)))
+            try:
+                rel.bulk_load(dict(key=np.arange(2, 5), value=np.arange(2, 5)))
+            finally:
+                assert_equal(len(self.test_no_extra), 3)
+                self.test_no_extra.delete_quick()
+
+    def test_bulk_load_bytes(self):
+        """Tests loading bytes that are not valid UTF-8 into a binary column"""
+        rel = schema.BinaryData()
+        rel.delete_quick()
+        data = [b'\xff\xfe\t\n\\\x00', 'caf\xe9'.encode('latin-1')]
+        with local_infile(rel) as loader:
+            loader.bulk_load(list(enumerate(data)))
+        assert_list_equal(list(rel.fetch('data', order_by='id')), data)
+        rel.delete_quick()
+
+    @raises(dj.DataJointError)
+    def test_bulk_load_invalid(self):
+        """Tests that bulk_load rejects values that insert would reject instead of storing them with a warning"""
+        self.test_no_extra.delete_quick()
+        with local_infile(self.test_no_extra) as rel:
+            try:
+                rel.bulk_load([(0, 0), (1, 'not a number')])
+            finally:
+                assert_equal(len(self.test_no_extra), 0)
+
+    @raises(dj.DataJointError)
+    def test_bulk_load_disabled(self):
+        """Tests that bulk_load requires a connection opened with local_infile"""
+        self.test_no_extra.bulk_load(dict(key=np.arange(3), value=np.arange(3)))
+
+    def test_heading_cache(self):
+        """Tests that headings of tables already seen by the connection are initialized without queries"""
+        connection = self.subject.connection
+        dj.FreeRelation(connection, self.subject.full_table_name).heading
+        with connection.collect_stats() as stats:
+            heading = dj.FreeRelation(connection, self.subject.full_table_name).heading
+        assert_list_equal(heading.names, self.subject.heading.names)
+        assert_equal(stats.top(), [])
+        # expired create times are read again to detect changes made by other clients
+        connection.heading_cache.ttl = 0
+        try:
+            with connection.collect_stats() as stats:
+                dj.FreeRelation(connection, self.subject.full_table_name).heading
+        finally:
+            connection.heading_cache.ttl = dj.config['connection.heading_cache_ttl']
+        assert_true(any('information_schema.tables' in sql for sql, _ in stats.top()))
+
     @raises(ProgrammingError)
     def test_drop(self):
         """Tests dropping tables"""
@@ -1,5 +1,6 @@
 import random
 import string
+import re
 
 import numpy as np
 from nose.tools import assert_raises, assert_equal, \
@@ -289,6 +290,83 @@ class TestRelational:
         e2 = Experiment() & dict(experiment_date=date)
         assert_true(len(e1) == len(e2) > 0, 'Two date restriction do not yield the same result')
 
+    @staticmethod
+    def test_compiled_sql():
+        """Test caching of compiled SQL and tracking of restricting attributes"""
+        x = B() & "mu>0.5" & [dict(id_a=1), dict(id_a=2)]
+        assert_true(x.make_sql() is x.make_sql(), 'compiled SQL is not cached')
+        assert_equal(x.attributes_in_restriction(), {'mu', 'id_a'})
+        assert_equal((B() - A()).attributes_in_restriction(), {'id_a'})
+        sql = x.make_sql()
+        x &= 'n>2'
+        assert_true(x.make_sql() != sql and x.make_sql().endswith('(n>2)'), 'restriction did not reset the cache')
+        assert_true(isinstance(x.proj('mu')._arg, dj.relational_operand.Subquery),
+                    'projecting out a restricting attribute requires a subquery')
+        assert_true(not isinstance(x.proj('mu', 'n')._arg, dj.relational_operand.Subquery),
+                    'unnecessary subquery')
+        y = x.proj('mu')
+        sql = y.make_sql()
+        x &= 'n>3'
+        assert_true(y.make_sql() != sql and '(n>3)' in y.make_sql(), 'restriction of an operand left stale SQL')
+        sql = y.make_sql()
+        B() & dict(id_a=1)
+        x & 'n>4'
+        assert_true(y.make_sql() is sql, 'an unrelated restriction discarded the cached SQL')
+        a = A() & 'id_a>0'
+        z = B() - a
+        sql = z.make_sql()
+        a &= 'id_a>1'
+        assert_true(z.make_sql() != sql and '(id_a>1)' in z.make_sql(),
+                    'restriction of a restricting relation left stale SQL')
+        j = A().proj() * B().proj()
+        sql = (j * j).make_sql()
+        aliases = re.findall(r'`_s[0-9a-f]+`', sql)
+        assert_equal(len(aliases), 4)
+        assert_equal(len(set(aliases)), 4, 'a join used twice in a query repeats its subquery aliases')
+        assert_equal(len(j * j), len(j))
+
+    @staticmethod
+    def test_key_table_restriction():
+        """Test restriction by large collections of keys uploaded to a temporary table"""
+        keys = B().fetch('KEY')[::3]
+        records = B().fetch()[::3]
+        expected = len(B() & keys)
+        expected_join = len((B() & keys) * D())
+        with dj.config(restriction__key_table_threshold=2):
+            rel = B() & keys
+            assert_true('`~keys_' in rel.make_sql(), 'keys were not uploaded')
+            assert_equal(len(rel), expected)
+            assert_equal(len(B() & records), expected)
+            assert_equal(len(B() - keys), len(B()) - expected)
+            assert_equal(len(rel * D()), expected_join)
+            assert_equal(len(rel & rel), expected)
+            # without the privilege to create temporary tables, the keys are restricted inline
+            access = B().connection._key_table_access
+            access[B().database] = False
+            try:
+                rel = B() & keys
+                assert_true('`~keys_' not in rel.make_sql(), 'keys were uploaded without privilege')
+                assert_equal(len(rel), expected)
+            finally:
+                access.pop(B().database)
+            # temporary tables are not created during a transaction, e.g. in make() called by populate
+            with B().connection.transaction:
+                rel = B() & keys
+                assert_true('`~keys_' not in rel.make_sql(), 'keys were uploaded during a transaction')
+                assert_equal(len(rel), expected)
+
+    @staticmethod
+    def test_exists():
+        """Test that emptiness and membership are checked with EXISTS queries"""
+        key = B().fetch('KEY')[0]
+        with dj.conn().collect_stats() as stats:
+            assert_true(B())
+            assert_false(B() & 'id_b < 0')
+            assert_true(key in B())
+            assert_false(dict(key, id_b=-1) in B())
+            assert_true(B().aggr(B.C(), n='count(*)') & 'n > 0')
+        assert_true(all(sql.startswith('SELECT EXISTS(') for sql, _ in stats.top(n=None)))
+
     @staticmethod
     def test_join_project_optimization():
         """Test optimization for join of projected relations with matching non-primary key"""
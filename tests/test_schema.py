@@ -1,5 +1,7 @@
-from nose.tools import assert_false, assert_true, raises
+import re
+from nose.tools import assert_false, assert_true, assert_equal, raises
 import datajoint as dj
+from datajoint.catalog import Catalog
 from inspect import getmembers
 from . import schema
 from . import schema_empty
@@ -36,6 +38,56 @@ def test_namespace_population():
             assert_true(getattr(rel, name_part).__base__ is dj.Part, 'Wrong tier for {name}'.format(name=name_part))
 
 
+def test_catalog():
+    connection = schema.schema.connection
+    catalog = Catalog(connection, schema.schema.database)
+    assert_true(schema.Ephys.Channel.table_name in catalog.tables)
+    assert_equal(catalog.primary_keys[schema.Trial.table_name], schema.Trial().primary_key)
+    # the keys read from information_schema agree with the table definitions in SHOW CREATE TABLE
+    names = re.compile(r'`([^`]+)`')
+    for table_name in catalog.tables:
+        definition = connection.query('SHOW CREATE TABLE `{db}`.`{tab}`'.format(
+            db=catalog.database, tab=table_name)).fetchone()[1]
+        primary_key = re.search(r'PRIMARY KEY \(([^)]+)\)', definition)
+        assert_equal(catalog.primary_keys.get(table_name, []),
+                     names.findall(primary_key.group(1)) if primary_key else [])
+        foreign_keys = {}
+        for name, attributes, referenced, referenced_attributes in re.findall(
+                r'CONSTRAINT `([^`]+)` FOREIGN KEY \(([^)]+)\) REFERENCES ((?:`[^`]+`\.)?`[^`]+`) \(([^)]+)\)',
+                definition):
+            foreign_keys[name] = dict(
+                attributes=names.findall(attributes), referenced_attributes=names.findall(referenced_attributes),
+                referenced_table=referenced if '.' in referenced else '`{db}`.{tab}'.format(
+                    db=catalog.database, tab=referenced))
+        assert_equal(dict(catalog.foreign_keys.get(table_name, {})), foreign_keys)
+
+
+def test_dependencies_cache():
+    deps = schema.schema.connection.dependencies
+    deps.load()
+    with schema.schema.connection.collect_stats() as stats:
+        deps.load()
+    assert_equal(sum(totals['calls'] for _, totals in stats.top()), 1)   # only checks for changes
+    deps.invalidate()
+    deps.load()
+    assert_true(schema.Ephys.Channel.full_table_name in deps)
+
+
+def test_virtual_module_introspection():
+    with schema.schema.connection.collect_stats() as stats:
+        module = dj.create_virtual_module('virtual_schema', schema.schema.database)
+    assert_true(hasattr(module, 'Experiment'))
+    assert_false(any(sql.startswith(('SHOW FULL COLUMNS', 'SHOW TABLE STATUS')) for sql, _ in stats.top(1000)))
+    with schema.schema.connection.collect_stats() as stats:
+        decorated = dj.schema(schema.schema.database, {}, connection=schema.schema.connection)
+        subject = decorated(type('Subject', (dj.Lookup,), dict(
+            definition=schema.Subject.definition, contents=schema.Subject.contents)))
+        assert_equal(subject().heading.names, schema.Subject().heading.names)
+    assert_false(any(sql.startswith(('SHOW TABLES', 'SHOW FULL COLUMNS', 'SHOW TABLE STATUS'))
+                     for sql, _ in stats.top(1000)))
+    schema.schema.connection.register(schema.schema)
+
+
 @raises(dj.DataJointError)
 def test_undecorated_table():
     """